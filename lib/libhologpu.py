@@ -1,7 +1,35 @@
 # Origin Author: TOMOYUKI KUROSAWA (https://github.com/kurokuman/Gerchberg-Saxton-algorithm)
 
+import hashlib
+import importlib
+import math
+import os
+import pickle
+import time
+
 import cv2
-import cupy as cp
+import numpy as np
+
+try:
+    import cupy as cp
+except ImportError:
+    # 无GPU/未安装CuPy的节点上仍可使用NumPy等后端
+    cp = None
+
+try:
+    import scipy.fft as spfft
+except ImportError:
+    spfft = None
+
+try:
+    import pyfftw
+except ImportError:
+    pyfftw = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
 
 
 def loadImg(string):
@@ -16,108 +44,1559 @@ def loadImg(string):
             return img
 
 
+# 计算后端相关
+# 默认后端，None时根据输入数组类型自动推断
+_defaultBackend = None
+
+
+def getBackend(backend=None):
+    """
+    获取数组计算后端
+
+    :param str|module backend: "numpy"、"cupy"、其他Array API模块名或命名空间，None时取默认后端(未设置则优先CuPy)
+    :return: xp - 数组命名空间
+    """
+    if backend is None:
+        backend = _defaultBackend
+    if backend is None:
+        return np if cp is None else cp
+    if not isinstance(backend, str):
+        return backend
+    if backend == "numpy":
+        return np
+    if backend == "cupy":
+        if cp is None:
+            raise ImportError("CuPy is not available, use backend='numpy' instead")
+        return cp
+    return importlib.import_module(backend)
+
+
+def setBackend(backend):
+    """
+    设置模块默认计算后端
+
+    :param str|module backend: 同getBackend，None时恢复为根据输入自动推断
+    """
+    global _defaultBackend
+    _defaultBackend = None if backend is None else getBackend(backend)
+
+
+def getArrayModule(*arrays):
+    """
+    根据输入数组推断其所属命名空间
+
+    :param arrays: 输入数组
+    :return: xp - 数组命名空间
+    """
+    for arr in arrays:
+        if cp is not None and isinstance(arr, cp.ndarray):
+            return cp
+        if isinstance(arr, np.ndarray):
+            return np
+        if hasattr(arr, "__array_namespace__"):
+            return arr.__array_namespace__()
+    return np
+
+
+def resolveBackend(backend, *arrays):
+    """
+    确定单次调用使用的后端：显式指定 > 模块默认 > 输入数组类型
+
+    :param str|module backend: 显式指定的后端
+    :param arrays: 输入数组
+    :return: xp - 数组命名空间
+    """
+    if backend is not None or _defaultBackend is not None:
+        return getBackend(backend)
+    return getArrayModule(*arrays)
+
+
+def toHost(arr):
+    """
+    将数组转换为主机端NumPy数组
+
+    :param arr: 任意后端数组
+    :return: numpy.ndarray
+    """
+    if cp is not None and isinstance(arr, cp.ndarray):
+        return cp.asnumpy(arr)
+    return np.asarray(arr)
+
+
+def freeMemory(xp=None):
+    """
+    释放后端内存池(仅CuPy有效)
+    """
+    if cp is not None and (xp is None or xp is cp):
+        cp.get_default_memory_pool().free_all_blocks()
+
+
+def synchronize(xp=None):
+    """
+    等待设备上已提交的运算完成(仅CuPy有效)，用于分阶段计时
+    """
+    if cp is not None and (xp is None or xp is cp):
+        cp.cuda.get_current_stream().synchronize()
+
+
+# 计算精度 -> (实数类型, 复数类型)
+PRECISIONS = {
+    "double": ("float64", "complex128"),
+    "single": ("float32", "complex64"),
+}
+
+
+def getDtypes(xp, precision="double"):
+    """
+    获取计算精度对应的数据类型
+
+    :param module xp: 数组命名空间
+    :param str precision: "double"(float64/complex128)或"single"(float32/complex64)
+    :return: realDtype - 实数类型, complexDtype - 复数类型
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"unknown precision: {precision}")
+    realName, complexName = PRECISIONS[precision]
+    return getattr(xp, realName), getattr(xp, complexName)
+
+
+def _angle(xp, u):
+    # Array API标准中没有angle
+    if hasattr(xp, "angle"):
+        return xp.angle(u)
+    return xp.atan2(xp.imag(u), xp.real(u))
+
+
+def _polar(xp, amp, phase):
+    # 由振幅与相位生成复振幅光场，amp为None时振幅为1
+    re = xp.cos(phase)
+    im = xp.sin(phase)
+    if amp is not None:
+        re = amp * re
+        im = amp * im
+    return _complex(xp, re, im)
+
+
+def _complex(xp, re, im):
+    # 由实部与虚部组成复数数组；Array API标准不允许实数数组与复数标量混合运算，先显式转换为对应精度的复数类型
+    if _isNative(xp):
+        return re + 1j * im
+    dtype = xp.complex64 if re.dtype == xp.float32 else xp.complex128
+    return _astype(xp, re, dtype) + _astype(xp, im, dtype) * 1j
+
+
+def _isNative(xp):
+    # NumPy/CuPy支持out=原地运算与按索引赋值，其他Array API后端只使用标准中的函数
+    return xp is np or (cp is not None and xp is cp)
+
+
+def _copy(xp, arr, dtype=None):
+    # NumPy<2与CuPy的asarray没有copy参数，Array API标准中没有array
+    if _isNative(xp):
+        return xp.array(arr, dtype=dtype, copy=True)
+    return xp.asarray(arr, dtype=dtype, copy=True)
+
+
+def _nbytes(xp, arr):
+    # Array API标准中没有nbytes，按元素数与类型位数计算
+    if hasattr(arr, "nbytes"):
+        return arr.nbytes
+    if xp.isdtype(arr.dtype, "bool"):
+        itemBits = 8
+    elif xp.isdtype(arr.dtype, "integral"):
+        itemBits = xp.iinfo(arr.dtype).bits
+    else:
+        # 复数类型的finfo位数为单个分量的位数
+        itemBits = xp.finfo(arr.dtype).bits * (2 if xp.isdtype(arr.dtype, "complex floating") else 1)
+    return math.prod(arr.shape) * itemBits // 8
+
+
+def _concat(xp, arrays, axis=0):
+    # Array API标准中为concat，NumPy<2与CuPy只有concatenate
+    if hasattr(xp, "concat"):
+        return xp.concat(arrays, axis=axis)
+    return xp.concatenate(arrays, axis=axis)
+
+
+def _astype(xp, arr, dtype):
+    if hasattr(xp, "astype"):
+        return xp.astype(arr, dtype)
+    return arr.astype(dtype)
+
+
+def _keepDtype(xp, arr, dtype):
+    # 部分FFT实现(如NumPy<2)会将单精度输入提升为双精度
+    if arr.dtype == dtype:
+        return arr
+    return _astype(xp, arr, dtype)
+
+
+# FFT引擎相关
+class FFTEngine:
+    """
+    直接调用后端自带的xp.fft(CuPy由cuFFT自行缓存计划)
+
+    fft2/ifft2的out参数为可选的输出数组(可与输入相同)，引擎不支持时忽略，调用方应以返回值为准
+    """
+    name = "native"
+    # 返回数组是否为引擎内部复用的缓冲区(非每次新分配)
+    ownsOutput = False
+
+    def __init__(self, xp=np):
+        self.xp = xp
+        # NumPy>=2的FFT支持out参数
+        self.supportsOut = xp is np and int(np.__version__.split(".")[0]) >= 2
+
+    def fft2(self, u, out=None):
+        if out is not None and self.supportsOut:
+            return self._transform2(self.xp.fft.fft, u, out)
+        # Array API标准只有fftn(以axes指定变换轴)，且要求复数输入
+        return self.xp.fft.fftn(self._complexInput(u), axes=(-2, -1))
+
+    def ifft2(self, u, out=None):
+        if out is not None and self.supportsOut:
+            return self._transform2(self.xp.fft.ifft, u, out)
+        return self.xp.fft.ifftn(self._complexInput(u), axes=(-2, -1))
+
+    def _complexInput(self, u):
+        xp = self.xp
+        if _isNative(xp) or xp.isdtype(u.dtype, "complex floating"):
+            return u
+        return _complex(xp, u, xp.zeros_like(u))
+
+    @staticmethod
+    def _transform2(transform, u, out):
+        # 逐轴一维变换写入out(np.fft.ifft2未向下传递out)，结果与fft2/ifft2一致
+        transform(u, axis=-1, out=out)
+        return transform(out, axis=-2, out=out)
+
+
+class ScipyFFTEngine(FFTEngine):
+    """
+    scipy.fft多线程FFT(pocketfft内部按形状/类型缓存计划)
+    """
+    name = "scipy"
+
+    def __init__(self, xp=np, workers=None):
+        if spfft is None:
+            raise ImportError("SciPy is not available")
+        if xp is not np:
+            raise ValueError("scipy.fft engine only supports the NumPy backend")
+        super().__init__(xp)
+        self.workers = workers or os.cpu_count()
+
+    def fft2(self, u, out=None):
+        return spfft.fft2(u, workers=self.workers)
+
+    def ifft2(self, u, out=None):
+        return spfft.ifft2(u, workers=self.workers)
+
+
+class PyFFTWEngine(FFTEngine):
+    """
+    pyFFTW多线程FFT，按(方向, 形状, 类型)缓存计划，wisdom持久化到磁盘
+
+    注意：返回数组为计划内部的输出缓冲区，同一计划下次调用时会被覆盖
+    """
+    name = "pyfftw"
+    ownsOutput = True
+
+    def __init__(self, xp=np, workers=None, wisdomFile=None, plannerEffort="FFTW_MEASURE"):
+        if pyfftw is None:
+            raise ImportError("pyFFTW is not available")
+        if xp is not np:
+            raise ValueError("pyFFTW engine only supports the NumPy backend")
+        super().__init__(xp)
+        self.workers = workers or os.cpu_count()
+        self.wisdomFile = wisdomFile or os.path.join(os.path.expanduser("~"), ".cache", "libhologpu", "fftw_wisdom.pkl")
+        self.plannerEffort = plannerEffort
+        self.plans = {}
+        self.loadWisdom()
+
+    def loadWisdom(self):
+        # 文件不存在、损坏(如写入中断)或来自不兼容的FFTW版本时忽略，重新规划
+        try:
+            with open(self.wisdomFile, "rb") as f:
+                pyfftw.import_wisdom(pickle.load(f))
+        except Exception:
+            pass
+
+    def saveWisdom(self):
+        os.makedirs(os.path.dirname(self.wisdomFile), exist_ok=True)
+        tmpPath = f"{self.wisdomFile}.{os.getpid()}.tmp"
+        with open(tmpPath, "wb") as f:
+            pickle.dump(pyfftw.export_wisdom(), f)
+        # 先写临时文件再替换，避免其他进程读到不完整的文件
+        os.replace(tmpPath, self.wisdomFile)
+
+    def _plan(self, builder, u):
+        key = (builder.__name__, u.shape, u.dtype.str)
+        plan = self.plans.get(key)
+        if plan is None:
+            plan = builder(pyfftw.empty_aligned(u.shape, dtype=u.dtype), threads=self.workers,
+                           planner_effort=self.plannerEffort, avoid_copy=False)
+            self.plans[key] = plan
+            self.saveWisdom()
+        return plan
+
+    def fft2(self, u, out=None):
+        return self._plan(pyfftw.builders.fft2, u)(u)
+
+    def ifft2(self, u, out=None):
+        return self._plan(pyfftw.builders.ifft2, u)(u)
+
+
+_fftEngines = {}
+
+
+def getFFTEngine(fft=None, xp=np, workers=None):
+    """
+    获取FFT引擎，同一后端下引擎实例(及其计划缓存)全局复用
+
+    :param str|FFTEngine fft: "native"、"scipy"、"pyfftw"、FFTEngine实例，None/"auto"时NumPy后端优先scipy，其他后端使用native
+    :param module xp: 数组命名空间
+    :param int workers: FFT线程数，None时使用全部CPU核心
+    :return: FFTEngine
+    """
+    if isinstance(fft, FFTEngine):
+        return fft
+    if fft is None or fft == "auto":
+        fft = "scipy" if xp is np and spfft is not None else "native"
+
+    key = (fft, xp.__name__, workers)
+    engine = _fftEngines.get(key)
+    if engine is None:
+        if fft == "native":
+            engine = FFTEngine(xp)
+        elif fft == "scipy":
+            engine = ScipyFFTEngine(xp, workers)
+        elif fft == "pyfftw":
+            engine = PyFFTWEngine(xp, workers)
+        else:
+            raise ValueError(f"unknown FFT engine: {fft}")
+        _fftEngines[key] = engine
+    return engine
+
+
+# 目标描述相关
+class TargetSpec:
+    """
+    编译后的目标描述，每帧构建一次，迭代中的加权、均匀性与效率计算只在光阱像素上进行
+
+    :ivar ndarray target: 目标图像
+    :ivar tuple shape: 目标图像尺寸
+    :ivar int size: 目标图像像素数
+    :ivar ndarray indices: 光阱像素(target == 1)的扁平索引
+    :ivar ndarray amplitude: 光阱像素处的目标振幅
+    :ivar int count: 光阱像素数
+    """
+
+    def __init__(self, targetImg, xp=None):
+        self._fftOrder = None
+        self._scatterIndex = None
+        self.xp = xp or getArrayModule(targetImg)
+        self.target = targetImg
+        self.shape = tuple(targetImg.shape)
+        self.size = math.prod(self.shape)
+
+        flat = self.xp.reshape(targetImg, (-1,))
+        self.indices = self.xp.nonzero(flat == 1)[0]
+        self.amplitude = self.xp.take(flat, self.indices)
+        self.count = int(self.indices.shape[0])
+
+    @property
+    def nbytes(self):
+        """
+        目标描述占用的字节数(含已构建的FFT顺序描述)
+        """
+        nbytes = sum(_nbytes(self.xp, arr) for arr in (self.target, self.indices, self.amplitude))
+        if self._fftOrder is not None:
+            nbytes += self._fftOrder.nbytes
+        return nbytes
+
+    def fftOrder(self):
+        """
+        FFT(未移位)顺序下的目标描述，即ifftshift(target)，每帧只构建一次
+
+        :return: TargetSpec
+        """
+        if self._fftOrder is None:
+            self._fftOrder = TargetSpec(self.xp.fft.ifftshift(self.target, axes=(-2, -1)), self.xp)
+        return self._fftOrder
+
+    def gather(self, arr):
+        """
+        取出全帧数组在光阱像素上的值
+
+        :param ndarray arr: 与目标同尺寸的数组
+        :return: 长度为count的紧凑向量
+        """
+        return self.xp.take(self.xp.reshape(arr, (-1,)), self.indices)
+
+    def scatter(self, values, dtype=None, base=None):
+        """
+        将紧凑向量写回全帧
+
+        :param ndarray values: 长度为count的向量
+        :param dtype: 输出类型，None时同values
+        :param ndarray base: 非光阱像素的取值(NumPy/CuPy下原地写入并返回)，None时为0
+        :return: 与目标同尺寸的数组
+        """
+        xp = self.xp
+        if _isNative(xp):
+            out = xp.zeros(self.shape, dtype=dtype or values.dtype) if base is None else base
+            xp.reshape(out, (-1,))[self.indices] = values
+            return out
+
+        # Array API标准中没有按索引赋值：各像素按其在光阱中的序号(非光阱为0)从[0, values]中gather
+        if self._scatterIndex is None:
+            mask = xp.reshape(self.target == 1, (-1,))
+            rank = xp.cumulative_sum(_astype(xp, mask, xp.int64))
+            self._scatterIndex = xp.where(mask, rank, xp.zeros_like(rank))
+        padded = _concat(xp, [xp.zeros(1, dtype=values.dtype), values])
+        out = xp.reshape(xp.take(padded, self._scatterIndex), self.shape)
+        if base is not None:
+            out = xp.where(self.target == 1, out, base)
+        return out if dtype is None else _astype(xp, out, dtype)
+
+
+def compileTarget(targetImg, xp=None):
+    """
+    构建目标描述，已是TargetSpec时原样返回
+
+    :param ndarray|TargetSpec targetImg: 目标图像
+    :param module xp: 数组命名空间，None时自动推断
+    :return: TargetSpec
+    """
+    if isinstance(targetImg, TargetSpec):
+        return targetImg
+    return TargetSpec(targetImg, xp)
+
+
 # 加权Gerchberg–Saxton算法相关
 def addWeight(weightedU, target, targetU, normIntensity):
     """
     向迭代光场添加权重(See Eq.19)
 
-    :param cupy.core.core.ndarray weightedU: 迭代前(k-1)加权光场强度
-    :param cupy.core.core.ndarray target: 目标图像
-    :param cupy.core.core.ndarray targetU: 目标光场
-    :param cupy.core.core.ndarray normIntensity: 归一化光强
+    target为TargetSpec时，weightedU、targetU、normIntensity均为光阱像素上的紧凑向量
+
+    :param ndarray weightedU: 迭代前(k-1)加权光场强度
+    :param ndarray|TargetSpec target: 目标图像或目标描述
+    :param ndarray targetU: 目标光场
+    :param ndarray normIntensity: 归一化光强
     :return: weightedU - 迭代后(k)加权光场强度
     """
-    weightedU[target == 1] = ((target[target == 1] / normIntensity[target == 1]) ** 0.5) * targetU[target == 1]
+    if isinstance(target, TargetSpec):
+        weightedU[...] = ((target.amplitude / normIntensity) ** 0.5) * targetU
+        return weightedU
+
+    mask = target == 1
+    weightedU[mask] = ((target[mask] / normIntensity[mask]) ** 0.5) * targetU[mask]
     return weightedU
 
 
-def uniformityCalc(intensity, target):
+def uniformityCalc(intensity, target, xp=None):
     """
     均匀性评价，达到一定值后终止迭代(See Eq.4-2)
 
-    :param cupy.core.core.ndarray intensity: 输入光场强度
-    :param cupy.core.core.ndarray target: 目标图像
+    target为TargetSpec时，intensity可为光阱像素上的紧凑向量(均匀性与整体缩放无关，无需全帧归一化)
+
+    :param ndarray intensity: 输入光场强度
+    :param ndarray|TargetSpec target: 目标图像或目标描述
+    :param module xp: 数组命名空间，None时自动推断
     :return: uniformity - 均匀性
     """
-    intensity = intensity / cp.max(intensity)
+    xp = xp or getArrayModule(intensity)
+    if isinstance(target, TargetSpec):
+        if intensity.shape != (target.count,):
+            intensity = target.gather(intensity)
+    else:
+        intensity = intensity / xp.max(intensity)
+        intensity = intensity[target == 1]
+
+    return float(_uniformity(xp, intensity))
+
+
+def _uniformity(xp, trapIntensity):
+    # 设备端归约，返回0维数组，不触发同步
+    maxI = xp.max(trapIntensity)
+    minI = xp.min(trapIntensity)
+    return 1 - (maxI - minI) / (maxI + minI)
+
+
+def _syncHistory(xp, history, unfmList):
+    # 迭代结束后一次性将设备端均匀性记录传回主机
+    if history:
+        unfmList.extend(float(v) for v in toHost(xp.stack(history)))
+
+
+def efficiencyCalc(normIntensity, target, xp=None):
+    """
+    衍射效率评价：目标区域归一化光强之和与目标之和的比值
 
-    maxI = cp.max(intensity[target == 1])
-    minI = cp.min(intensity[target == 1])
+    :param ndarray normIntensity: 归一化光强(全帧，target为TargetSpec时也可为紧凑向量)
+    :param ndarray|TargetSpec target: 目标图像或目标描述
+    :param module xp: 数组命名空间，None时自动推断
+    :return: efficiency - 效率
+    """
+    xp = xp or getArrayModule(normIntensity)
+    if isinstance(target, TargetSpec):
+        if normIntensity.shape != (target.count,):
+            normIntensity = target.gather(normIntensity)
+        return float(xp.sum(normIntensity) / xp.sum(target.amplitude))
 
-    uniformity = float(1 - (maxI - minI) / (maxI + minI))
+    mask = target == 1
+    return float(xp.sum(normIntensity[mask]) / xp.sum(target[mask]))
 
-    return uniformity
 
+# Numba融合核(仅NumPy后端)：GS迭代中FFT以外的全帧逐元素运算合并为每次迭代两次遍历
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def _fusedAbs2MaxMin(u, intensity, chunkNum):
+        # 一次遍历写出|u|^2并求最大、最小值(分chunkNum块归约，取线程数；由调用方传入，
+        # 核内调用get_num_threads会使cache=True无法缓存)
+        flatU = u.reshape(-1)
+        flatI = intensity.reshape(-1)
+        size = flatU.shape[0]
+        chunk = (size + chunkNum - 1) // chunkNum
+        maxs = np.full(chunkNum, -np.inf)
+        mins = np.full(chunkNum, np.inf)
+        for c in numba.prange(chunkNum):
+            localMax, localMin = -np.inf, np.inf
+            for i in range(c * chunk, min((c + 1) * chunk, size)):
+                value = flatU[i].real * flatU[i].real + flatU[i].imag * flatU[i].imag
+                flatI[i] = value
+                localMax = max(localMax, value)
+                localMin = min(localMin, value)
+            maxs[c] = localMax
+            mins[c] = localMin
+        return maxs.max(), mins.min()
 
-def GSiteration(maxIterNum: int, uniThres: float, targetImg, unfmList: list):
+    @numba.njit(parallel=True, cache=True)
+    def _fusedUnitField(u):
+        # 原地u = exp(i * angle(u)) = u / |u|，即相位提取与下一次迭代的LCOS光场合并为一次遍历，无需三角函数
+        flatU = u.reshape(-1)
+        for i in numba.prange(flatU.shape[0]):
+            re, im = flatU[i].real, flatU[i].imag
+            magnitude = np.sqrt(re * re + im * im)
+            if magnitude > 0:
+                flatU[i] = complex(re / magnitude, im / magnitude)
+            else:
+                flatU[i] = 1
+
+
+def _checkFused(xp):
+    if numba is None:
+        raise ImportError("Numba is not available")
+    if xp is not np:
+        raise ValueError("fused kernels only support the NumPy backend")
+
+
+def GSiteration(maxIterNum: int, uniThres: float, targetImg, unfmList: list, backend=None, fft=None,
+                precision="double", shiftFree=True, initPhase=None, checkEvery=1, algorithm="wgs", mixing=0.5,
+                signalRegion=None, signalMargin=50, fused=False, metrics=None):
     """
     GS迭代算法
 
     :param int maxIterNum: 最大迭代次数
     :param float uniThres: 迭代目标（均匀性）
-    :param cupy.core.core.ndarray targetImg: 目标图像
+    :param ndarray|TargetSpec targetImg: 目标图像(可为主机端数组，将被转换至计算后端)或已构建的目标描述
     :param list unfmList: 均匀性记录
+    :param str|module backend: 计算后端("numpy"/"cupy"/Array API命名空间)，None时按getBackend规则推断
+    :param str|FFTEngine fft: FFT引擎，见getFFTEngine
+    :param str precision: 计算精度，"double"或"single"(全程float32/complex64)
+    :param bool shiftFree: 在未移位的FFT顺序下迭代(目标预先ifftshift)，省去每次迭代的fftshift/ifftshift，结果不变
+    :param ndarray initPhase: 初始迭代相位(如上一帧收敛的相位，即热启动)，None时以目标光场IFFT作为初始相位
+    :param int checkEvery: 每隔多少次迭代检查一次收敛(仅检查时与主机同步)，均匀性记录保存在设备端，结束时一次性写入unfmList
+    :param str algorithm: "wgs"(加权GS)或"mraf"(混合区域振幅自由，只在信号区内约束振幅)
+    :param float mixing: MRAF混合系数m，信号区振幅取m倍目标，噪声区取(1 - m)倍当前振幅
+    :param ndarray signalRegion: MRAF信号区掩膜(与目标同尺寸，图像顺序)，None时取光阱外接矩形外扩signalMargin像素
+    :param int signalMargin: 默认信号区的外扩像素数
+    :param bool fused: 使用Numba融合核(仅NumPy后端)，|u|^2与最值归约合并为一次遍历，
+        相位提取与LCOS光场合并为u/|u|一次遍历，相位只在结束时计算；结果与逐项运算在舍入误差内一致
+    :param dict metrics: 求解指标记录，见HoloSolver.solve，None时不记录
     :return: phase - 相位, normIntensity - 归一化光强
     """
-    height, width = targetImg.shape[:2]
-    # (deprecated)初始迭代相位：以随机相位分布作为初始迭代相位
-    # phase = cp.random.rand(height, width)
-    # 初始迭代相位：以目标光场IFFT作为初始迭代相位以增强均匀性
-    # initU = cp.fft.ifftshift(cp.fft.ifft2(targetImg))
-    # phase = cp.angle(initU) + 2*cp.pi*(cp.random.uniform(0,1,(height, width))-0.5)/cp.sinc(cp.abs(initU)))
-    phase = cp.fft.ifftshift(cp.fft.ifft2(targetImg))
-    # 光场复振幅：生成和target相同尺寸的空数组
-    u = cp.empty_like(targetImg, dtype="complex")
-    # 初始
-    targetU = targetImg
-    # 初始化权重数组
-    weightedU = cp.empty_like(targetImg)
+    xp = targetImg.xp if isinstance(targetImg, TargetSpec) else resolveBackend(backend, targetImg)
+    solver = getSolver(xp, fft, precision)
+    solver.maxIterNum = maxIterNum
+    solver.uniThres = uniThres
+    solver.shiftFree = shiftFree
+    solver.checkEvery = checkEvery
+    if algorithm not in ("wgs", "mraf"):
+        raise ValueError(f"unknown algorithm: {algorithm}")
+    solver.algorithm = algorithm
+    solver.mixing = mixing
+    solver.signalRegion = signalRegion
+    solver.signalMargin = signalMargin
+    if fused:
+        _checkFused(xp)
+    solver.fused = fused
+    return solver.solve(targetImg, unfmList, initPhase, metrics)
 
-    for n in range(maxIterNum):
-        # 输入到LCOS上的复振幅光场，设入射LCOS的初始光强相对值为1，N=1为随机相位，N>1为迭代相位
-        u.real = cp.cos(phase)
-        u.imag = cp.sin(phase)
 
-        # 模拟透镜传递函数（向光阱正向传播）
-        u = cp.fft.fft2(u)
-        u = cp.fft.fftshift(u)
-        # ---------------------------------
+# 有状态求解器相关
+class HoloSolver:
+    """
+    有状态的GS求解器：按尺寸与精度预分配光场、光强、相位与权重工作区，在迭代与帧之间复用。
+    NumPy/CuPy后端下迭代中的逐元素运算均以out=原地完成，其他Array API后端退化为逐次分配
+
+    :ivar int allocatedBytes: 最近一帧求解中新分配的字节数(工作区扩容、目标描述、非原地FFT输出与结果拷贝)
+    """
+
+    def __init__(self, maxIterNum=100, uniThres=0.66, backend=None, fft=None, precision="double",
+                 shiftFree=True, checkEvery=1, copyOutput=True, algorithm="wgs", mixing=0.5, signalRegion=None,
+                 signalMargin=50, fused=False):
+        """
+        :param int maxIterNum: 最大迭代次数
+        :param float uniThres: 迭代目标（均匀性）
+        :param str|module backend: 计算后端，见getBackend
+        :param str|FFTEngine fft: FFT引擎，见getFFTEngine
+        :param str precision: 计算精度，"double"或"single"
+        :param bool shiftFree: 见GSiteration
+        :param int checkEvery: 见GSiteration
+        :param bool copyOutput: 返回结果的拷贝；为False时直接返回工作区数组，下次solve时会被覆盖
+        :param str algorithm: 见GSiteration
+        :param float mixing: 见GSiteration
+        :param ndarray signalRegion: 见GSiteration
+        :param int signalMargin: 见GSiteration
+        :param bool fused: 见GSiteration
+        """
+        self.maxIterNum = maxIterNum
+        self.uniThres = uniThres
+        if algorithm not in ("wgs", "mraf"):
+            raise ValueError(f"unknown algorithm: {algorithm}")
+        self.algorithm = algorithm
+        self.mixing = mixing
+        self.signalRegion = signalRegion
+        self.signalMargin = signalMargin
+        self.xp = getBackend(backend)
+        self.engine = getFFTEngine(fft, self.xp)
+        self.precision = precision
+        self.realDtype, self.complexDtype = getDtypes(self.xp, precision)
+        self.shiftFree = shiftFree
+        self.checkEvery = checkEvery
+        self.copyOutput = copyOutput
+        if fused:
+            _checkFused(self.xp)
+        self.fused = fused
+        # 是否支持out=原地运算
+        self.inplace = _isNative(self.xp)
+        self.workspace = {}
+        self.allocatedBytes = 0
+
+    @property
+    def workspaceBytes(self):
+        """
+        工作区总字节数
+        """
+        return sum(_nbytes(self.xp, buf) for buf in self.workspace.values())
+
+    def compile(self, targetImg):
+        """
+        将目标图像转换为本求解器后端与精度下的目标描述
+
+        :param ndarray|TargetSpec targetImg: 目标图像或目标描述
+        :return: TargetSpec
+        """
+        if isinstance(targetImg, TargetSpec):
+            if targetImg.xp is self.xp and targetImg.target.dtype == self.realDtype:
+                return targetImg
+            targetImg = targetImg.target
+        spec = TargetSpec(self.xp.asarray(targetImg, dtype=self.realDtype), self.xp)
+        self.allocatedBytes += spec.nbytes
+        return spec
+
+    def _buffer(self, name, shape, dtype):
+        # 获取工作区数组，尺寸或类型变化时重新分配；一维紧凑向量只增不减，返回前shape[0]个元素
+        buf = self.workspace.get(name)
+        if len(shape) == 1:
+            if buf is None or buf.shape[0] < shape[0] or buf.dtype != dtype:
+                buf = self.xp.empty(shape, dtype=dtype)
+                self.workspace[name] = buf
+                self.allocatedBytes += _nbytes(self.xp, buf)
+            return buf[:shape[0]]
+        if buf is None or tuple(buf.shape) != tuple(shape) or buf.dtype != dtype:
+            buf = self.xp.empty(shape, dtype=dtype)
+            self.workspace[name] = buf
+            self.allocatedBytes += _nbytes(self.xp, buf)
+        return buf
+
+    def _track(self, result, out=None):
+        # 统计未能原地完成的运算所分配的字节数
+        if result is not out:
+            self.allocatedBytes += _nbytes(self.xp, result)
+        return result
+
+    def _polarInto(self, amp, phase, out):
+        # out = amp * exp(i * phase)
+        if not self.inplace:
+            return self._track(_polar(self.xp, amp, phase))
+        self.xp.cos(phase, out=out.real)
+        self.xp.sin(phase, out=out.imag)
+        if amp is not None:
+            self.xp.multiply(amp, out.real, out=out.real)
+            self.xp.multiply(amp, out.imag, out=out.imag)
+        return out
+
+    def _angleInto(self, u, out):
+        if not self.inplace:
+            return self._track(_angle(self.xp, u))
+        return self.xp.arctan2(u.imag, u.real, out=out)
+
+    def _abs2Into(self, u, out):
+        if not self.inplace:
+            return self._track(self.xp.abs(u) ** 2)
+        self.xp.abs(u, out=out)
+        return self.xp.square(out, out=out)
+
+    def _gatherInto(self, spec, arr, out):
+        if not self.inplace:
+            return self._track(spec.gather(arr))
+        return self.xp.take(self.xp.reshape(arr, (-1,)), spec.indices, out=out)
+
+    def _fft(self, u, inverse=False, inplace=True):
+        transform = self.engine.ifft2 if inverse else self.engine.fft2
+        result = _keepDtype(self.xp, transform(u, out=u if inplace else None), self.complexDtype)
+        if result is not u and not self.engine.ownsOutput:
+            self.allocatedBytes += _nbytes(self.xp, result)
+        return result
+
+    def _initField(self, spec, initPhase, u):
+        # 初始光场：给定initPhase时热启动，否则同GSiteration以目标光场IFFT作为初始相位
+        xp = self.xp
+        if initPhase is not None:
+            return self._polarInto(None, xp.asarray(initPhase, dtype=self.realDtype), u)
+
+        initU = self._track(xp.fft.ifftshift(self._fft(spec.target, inverse=True, inplace=False)))
+        # 首次迭代时相位为复数光场，取cos/sin的实部作为LCOS上的初始光场
+        if not self.inplace:
+            return self._track(_complex(xp, xp.real(xp.cos(initU)), xp.real(xp.sin(initU))))
+        xp.sin(initU, out=u)
+        u.imag[...] = u.real
+        xp.cos(initU, out=initU)
+        u.real[...] = initU.real
+        return u
+
+    def _noiseAmplitude(self, spec):
+        # MRAF噪声区振幅系数：信号区为0，噪声区为(1 - mixing)，迭代顺序同光场
+        xp = self.xp
+        if self.signalRegion is None:
+            # 默认信号区为光阱外接矩形向外扩展signalMargin像素
+            height, width = spec.shape
+            rows = spec.indices // width
+            cols = spec.indices % width
+            top = max(int(xp.min(rows)) - self.signalMargin, 0)
+            bottom = min(int(xp.max(rows)) + self.signalMargin + 1, height)
+            left = max(int(xp.min(cols)) - self.signalMargin, 0)
+            right = min(int(xp.max(cols)) + self.signalMargin + 1, width)
+            noise = xp.full(spec.shape, 1 - self.mixing, dtype=self.realDtype)
+            noise[top:bottom, left:right] = 0
+        else:
+            noise = (1 - xp.asarray(self.signalRegion, dtype=self.realDtype)) * (1 - self.mixing)
+        if self.shiftFree:
+            noise = xp.fft.ifftshift(noise)
+        return self._track(noise)
+
+    def solve(self, targetImg, unfmList=None, initPhase=None, metrics=None):
+        """
+        求解一帧
+
+        :param ndarray|TargetSpec targetImg: 目标图像或目标描述
+        :param list unfmList: 均匀性记录，None时不记录
+        :param ndarray initPhase: 初始迭代相位，见GSiteration
+        :param dict metrics: 求解指标记录，None时不记录；写入iterations(迭代数)、uniformity(均匀性记录)、
+            efficiency(由最后一次迭代的光阱光强在设备端计算，与均匀性记录一并传回主机)、
+            timings(各阶段耗时(s)：setup - 目标与工作区准备及初始光场，iterate - 迭代，finalize - 结果整理)。
+            计时在阶段边界与设备同步，仅记录指标时如此
+        :return: phase - 相位, normIntensity - 归一化光强
+        """
+        xp = self.xp
+        timed = metrics is not None
+        Tstart = time.time()
+        self.allocatedBytes = 0
+        spec = self.compile(targetImg)
+        # 焦平面一侧的迭代顺序
+        if self.shiftFree:
+            if spec._fftOrder is None:
+                self.allocatedBytes += _nbytes(xp, spec.fftOrder())
+            work = spec.fftOrder()
+        else:
+            work = spec
+
+        # 工作区(以下光阱相关数组均为光阱像素上的紧凑向量)
+        u = self._buffer("u", spec.shape, self.complexDtype)
+        intensity = self._buffer("intensity", spec.shape, self.realDtype)
+        phase = self._buffer("phase", spec.shape, self.realDtype)
+        trapU = self._buffer("trapU", (work.count,), self.complexDtype)
+        trapIntensity = self._buffer("trapIntensity", (work.count,), self.realDtype)
+        trapPhase = self._buffer("trapPhase", (work.count,), self.realDtype)
+        normIntensity = self._buffer("normIntensity", (work.count,), self.realDtype)
+        # 权重数组以目标振幅初始化(非光阱区域权重恒为0，无需存储)
+        weightedU = self._buffer("weightedU", (work.count,), self.realDtype)
+        weightedU[...] = work.amplitude
+        # 全帧归一化时非光阱像素(0)参与取最小值
+        hasBackground = work.count < work.size
+        # 设备端均匀性记录
+        history = []
+
+        if self.algorithm == "mraf":
+            amplitude = self._buffer("amplitude", spec.shape, self.realDtype)
+            noiseAmplitude = self._noiseAmplitude(spec)
+
+        u = self._initField(spec, initPhase, u)
+        if timed:
+            synchronize(xp)
+            Tsetup = time.time()
+
+        for n in range(self.maxIterNum):
+            # 输入到LCOS上的复振幅光场，设入射LCOS的初始光强相对值为1(融合核已在上次迭代末尾写入u)
+            if n > 0 and not self.fused:
+                u = self._polarInto(None, phase, u)
+
+            # 模拟透镜传递函数（向光阱正向传播）
+            u = self._fft(u)
+            if not self.shiftFree:
+                u = self._track(xp.fft.fftshift(u))
+            # ---------------------------------
+
+            # I=|u|^2
+            if self.fused:
+                maxI, minI = _fusedAbs2MaxMin(u, intensity, numba.get_num_threads())
+            else:
+                intensity = self._abs2Into(u, intensity)
+                maxI = xp.max(intensity)
+                minI = xp.min(intensity)
+            # 光阱处的光场与归一化光强
+            trapU = self._gatherInto(work, u, trapU)
+            trapIntensity = self._gatherInto(work, intensity, trapIntensity)
+            normIntensity[...] = trapIntensity
+            normIntensity -= minI
+            normIntensity /= maxI - minI
+
+            # 生成光场的均匀度(设备端)
+            history.append(_uniformity(xp, trapIntensity))
+
+            # 加权(See Eq.19)并归一化；光阱像素恰为全帧最小光强时归一化光强为0，该光阱本次不更新权重(否则除零得到NaN)
+            if self.inplace:
+                xp.copyto(normIntensity, work.amplitude, where=normIntensity <= 0)
+                xp.divide(work.amplitude, normIntensity, out=normIntensity)
+                xp.sqrt(normIntensity, out=normIntensity)
+            else:
+                normIntensity = (work.amplitude / xp.where(normIntensity > 0, normIntensity, work.amplitude)) ** 0.5
+            weightedU *= normIntensity
+            maxW = xp.max(weightedU)
+            minW = 0 if hasBackground else xp.min(weightedU)
+            weightedU -= minW
+            weightedU /= maxW - minW
+
+            trapPhase = self._angleInto(trapU, trapPhase)
+            trapU = self._polarInto(weightedU, trapPhase, trapU)
+            if self.algorithm == "mraf":
+                # MRAF：信号区内约束振幅(光阱为mixing倍加权目标，其余为0)，噪声区保留(1 - mixing)倍归一化振幅
+                amplitude[...] = intensity
+                amplitude -= minI
+                amplitude /= maxI - minI
+                if self.inplace:
+                    xp.sqrt(amplitude, out=amplitude)
+                else:
+                    amplitude = xp.sqrt(amplitude)
+                amplitude *= noiseAmplitude
+                phase = self._angleInto(u, phase)
+                u = self._polarInto(amplitude, phase, u)
+                trapU *= self.mixing
+            elif self.inplace:
+                u[...] = 0
+            if self.inplace:
+                xp.reshape(u, (-1,))[work.indices] = trapU
+            else:
+                # 其他Array API后端不支持按索引赋值，以gather重建全帧(MRAF时非光阱像素保留u)
+                u = self._track(work.scatter(trapU, base=u if self.algorithm == "mraf" else None))
+
+            # 模拟透镜传递函数（向LCOS反向传播）
+            if not self.shiftFree:
+                u = self._track(xp.fft.ifftshift(u))
+            u = self._fft(u, inverse=True)
+            # ---------------------------------
+
+            if self.fused:
+                _fusedUnitField(u)
+            else:
+                phase = self._angleInto(u, phase)
 
-        phase = cp.angle(u)
+            # 检查均匀度
+            if (n + 1) % self.checkEvery == 0 and bool(history[-1] >= self.uniThres):
+                break
 
-        # I=|u|^2
-        intensity = cp.abs(u) ** 2
-        # 归一化光强
-        normIntensity = normalize(intensity)
+        if timed:
+            synchronize(xp)
+            Titerate = time.time()
+            # 效率 = 光阱处归一化光强之和 / 目标振幅之和，光阱光强仍为最后一次迭代的值
+            efficiency = (xp.sum(trapIntensity) - work.count * minI) / ((maxI - minI) * xp.sum(work.amplitude))
+            values = [float(v) for v in toHost(xp.stack(history + [xp.asarray(efficiency, dtype=self.realDtype)]))]
+            metrics.update(iterations=len(history), uniformity=values[:-1], efficiency=values[-1])
+            if unfmList is not None:
+                unfmList.extend(values[:-1])
+        elif unfmList is not None:
+            _syncHistory(xp, history, unfmList)
+        if self.fused:
+            phase = self._angleInto(u, phase)
 
-        # 检查生成光场的均匀度
-        uniformity = uniformityCalc(intensity, targetImg)
-        unfmList.append(uniformity)
+        # 归一化光强只在输出时计算一次全帧，并换回图像(移位后)顺序
+        intensity -= minI
+        intensity /= maxI - minI
+        if self.shiftFree:
+            intensity = self._track(xp.fft.fftshift(intensity))
+        elif self.copyOutput:
+            intensity = self._track(_copy(xp, intensity))
+        if self.copyOutput:
+            phase = self._track(_copy(xp, phase))
+        if timed:
+            synchronize(xp)
+            metrics["timings"] = {"setup": Tsetup - Tstart, "iterate": Titerate - Tsetup,
+                                  "finalize": time.time() - Titerate}
 
-        weightedU = addWeight(weightedU, targetImg, targetU, normIntensity)
-        weightedU = normalize(weightedU)
+        return (phase, intensity)
+
+
+_solvers = {}
+
+
+def getSolver(backend=None, fft=None, precision="double", level=0):
+    """
+    获取模块级共享求解器(工作区在多次GSiteration调用间复用)
+
+    :param str|module backend: 计算后端
+    :param str|FFTEngine fft: FFT引擎
+    :param str precision: 计算精度
+    :param int level: 金字塔层级，各层尺寸不同，分别使用独立求解器以免工作区反复重分配
+    :return: HoloSolver
+    """
+    xp = getBackend(backend)
+    engine = getFFTEngine(fft, xp)
+    key = (xp.__name__, id(engine), precision, level)
+    solver = _solvers.get(key)
+    if solver is None:
+        solver = HoloSolver(backend=xp, fft=engine, precision=precision)
+        _solvers[key] = solver
+    return solver
+
+
+def targetOffset(target, refTarget, tolerance=0.0, xp=None):
+    """
+    判断目标是否为参考目标的平移：按光阱像素质心求整像素位移，参考目标循环移位后与目标的变化程度不超过tolerance时成立
+
+    :param ndarray|TargetSpec target: 当前帧目标
+    :param ndarray|TargetSpec refTarget: 参考目标
+    :param float tolerance: 允许的变化程度，见targetChange
+    :param module xp: 数组命名空间，None时自动推断
+    :return: (dx, dy)，不是平移时为None
+    """
+    if isinstance(target, TargetSpec):
+        target = target.target
+    if isinstance(refTarget, TargetSpec):
+        refTarget = refTarget.target
+    xp = xp or getArrayModule(target)
+
+    def centroid(img):
+        rows, cols = xp.nonzero(img == 1)
+        if rows.shape[0] == 0:
+            return None
+        return float(xp.mean(_astype(xp, cols, xp.float64))), float(xp.mean(_astype(xp, rows, xp.float64)))
+
+    center, refCenter = centroid(target), centroid(refTarget)
+    if center is None or refCenter is None:
+        return None
+    dx, dy = round(center[0] - refCenter[0]), round(center[1] - refCenter[1])
+    if targetChange(xp.roll(refTarget, (dy, dx), axis=(0, 1)), target, xp) > tolerance:
+        return None
+    return dx, dy
+
+
+def shiftPhase(phase, dx, dy, xp=None):
+    """
+    按傅里叶平移定理，叠加闪耀光栅相位 2pi * (dx * x / W + dy * y / H)，使重建图样平移(dx, dy)像素(可为小数)。
+    整像素平移时光强分布与对平移后目标求解的结果一致(循环移位)
+
+    :param ndarray phase: 参考相位
+    :param float dx: x方向平移(像素)
+    :param float dy: y方向平移(像素)
+    :param module xp: 数组命名空间，None时自动推断
+    :return: phase - 平移后的相位，范围[0, 2pi)
+    """
+    xp = xp or getArrayModule(phase)
+    height, width = phase.shape
+    # 光栅相位可分离，按行列广播相加，一次遍历
+    rampX = xp.reshape(xp.arange(width, dtype=phase.dtype) * (2 * math.pi * dx / width), (1, -1))
+    rampY = xp.reshape(xp.arange(height, dtype=phase.dtype) * (2 * math.pi * dy / height), (-1, 1))
+    return xp.remainder(phase + rampX + rampY, 2 * math.pi)
+
+
+def _downsampleTarget(xp, target, factor):
+    # 按factor×factor块取最大值降采样，保留粗层中的小光点
+    height, width = target.shape
+    blocks = xp.reshape(target, (height // factor, factor, width // factor, factor))
+    return xp.max(xp.max(blocks, axis=3), axis=1)
+
+
+def _upsamplePhase(xp, phase):
+    # 相位按2×2平铺上采样，焦平面光场为粗层光场在偶数坐标上的采样；单纯平铺时奇数坐标处光强恒为0，
+    # 故右侧与下侧副本各附加pi/2相移，使奇数坐标处为插值光场，避免下一层首次加权时除零
+    height, width = phase.shape
+    offset = xp.asarray([[0, xp.pi / 2], [xp.pi / 2, xp.pi]], dtype=phase.dtype)
+    offset = xp.repeat(xp.repeat(offset, height, axis=0), width, axis=1)
+    return xp.tile(phase, (2, 2)) + offset
+
+
+def GSpyramid(maxIterNum: int, uniThres: float, targetImg, unfmList: list, levels=2, levelIters=None, backend=None,
+              fft=None, precision="double", checkEvery=1, fused=False):
+    """
+    多分辨率(由粗到细)GS迭代：先在按2^l降采样的目标上迭代，再将相位按2×2平铺上采样作为下一层的初始相位，
+    最后在全分辨率下精修。傅里叶全息图平铺后焦平面坐标加倍，故粗层目标取对应块的最大值(见_upsamplePhase)
+
+    :param int maxIterNum: 全分辨率层的最大迭代次数
+    :param float uniThres: 迭代目标（均匀性），各层达到即进入下一层
+    :param ndarray|TargetSpec targetImg: 目标图像或目标描述
+    :param list unfmList: 均匀性记录(各层依次追加)
+    :param int levels: 层数(含全分辨率层)，尺寸不能被2^(levels-1)整除时自动减少
+    :param list levelIters: 由粗到细各粗层的最大迭代次数(须为levels-1个，否则抛出ValueError)，None时均为maxIterNum
+    :param str|module backend: 计算后端，见GSiteration
+    :param str|FFTEngine fft: FFT引擎，见getFFTEngine
+    :param str precision: 计算精度
+    :param int checkEvery: 每隔多少次迭代检查一次收敛
+    :param bool fused: 见GSiteration
+    :return: phase - 相位, normIntensity - 归一化光强
+    """
+    if isinstance(targetImg, TargetSpec):
+        xp, target = targetImg.xp, targetImg.target
+    else:
+        xp = resolveBackend(backend, targetImg)
+        target = xp.asarray(targetImg)
+    if fused:
+        _checkFused(xp)
+    if levelIters is not None and len(levelIters) != max(levels - 1, 0):
+        raise ValueError(f"levelIters needs {max(levels - 1, 0)} entries for {levels} levels, got {len(levelIters)}")
+    height, width = target.shape
+    while levels > 1 and (height % 2 ** (levels - 1) or width % 2 ** (levels - 1)):
+        levels -= 1
+    if levelIters is None:
+        levelIters = [maxIterNum] * (levels - 1)
+    # 层数减少时舍去最粗的层
+    levelIters = list(levelIters)[len(levelIters) - (levels - 1):] if levels > 1 else []
+
+    phase = None
+    for level in range(levels - 1, -1, -1):
+        solver = getSolver(xp, fft, precision, level)
+        solver.maxIterNum = maxIterNum if level == 0 else levelIters[levels - 1 - level]
+        solver.uniThres = uniThres
+        solver.shiftFree = True
+        solver.checkEvery = checkEvery
+        solver.algorithm = "wgs"
+        solver.fused = fused
+        levelTarget = targetImg if level == 0 else _downsampleTarget(xp, target, 2 ** level)
+        if phase is not None:
+            phase = _upsamplePhase(xp, phase)
+        phase, normIntensity = solver.solve(levelTarget, unfmList, phase)
+    return phase, normIntensity
+
+
+def targetChange(target, prevTarget, xp=None):
+    """
+    两帧目标的变化程度：光阱像素的对称差占并集的比例，用于判断能否热启动
+
+    :param ndarray|TargetSpec target: 当前帧目标
+    :param ndarray|TargetSpec prevTarget: 上一帧目标
+    :param module xp: 数组命名空间，None时自动推断
+    :return: change - 0(相同)~1(无重合)
+    """
+    if isinstance(target, TargetSpec):
+        target = target.target
+    if isinstance(prevTarget, TargetSpec):
+        prevTarget = prevTarget.target
+    xp = xp or getArrayModule(target)
+
+    trap = target == 1
+    prevTrap = prevTarget == 1
+    union = int(xp.count_nonzero(trap | prevTrap))
+    if union == 0:
+        return 0.0
+    return int(xp.count_nonzero(trap != prevTrap)) / union
+
+
+def GSiterationBatch(maxIterNum: int, uniThres: float, targetImgs, unfmLists: list = None, backend=None, fft=None,
+                     precision="double"):
+    """
+    批量GS迭代算法：对(N, H, W)目标栈沿首轴做批量FFT，各帧独立判断收敛，已收敛的帧移出批次不再参与计算
+
+    单帧结果与GSiteration一致。批次内按索引赋值不在Array API标准中，仅支持NumPy/CuPy后端
+
+    :param int maxIterNum: 最大迭代次数
+    :param float uniThres: 迭代目标（均匀性）
+    :param ndarray targetImgs: 目标图像栈(N, H, W)，可为主机端数组
+    :param list unfmLists: 各帧均匀性记录(N个list)，None时新建
+    :param str|module backend: 计算后端，见GSiteration
+    :param str|FFTEngine fft: FFT引擎，见getFFTEngine
+    :param str precision: 计算精度，"double"或"single"
+    :return: phase - 相位(N, H, W), normIntensity - 归一化光强(N, H, W)
+    """
+    xp = resolveBackend(backend, targetImgs)
+    if not _isNative(xp):
+        raise ValueError("GSiterationBatch only supports the NumPy and CuPy backends")
+    realDtype, complexDtype = getDtypes(xp, precision)
+    targets = xp.asarray(targetImgs, dtype=realDtype)
+    engine = getFFTEngine(fft, xp)
+    frameNum, height, width = targets.shape
+    if unfmLists is None:
+        unfmLists = [[] for _ in range(frameNum)]
+
+    # 各帧FFT顺序下的光阱索引，以末个索引补齐到相同长度(重复元素不影响逐元素运算与最大/最小值)
+    specs = [TargetSpec(targets[k], xp).fftOrder() for k in range(frameNum)]
+    maxCount = max(spec.count for spec in specs)
+    pad = [xp.minimum(xp.arange(maxCount), spec.count - 1) for spec in specs]
+    indices = xp.stack([xp.take(spec.indices, pad[k]) for k, spec in enumerate(specs)])
+    amplitude = xp.stack([xp.take(spec.amplitude, pad[k]) for k, spec in enumerate(specs)])
+    hasBackground = xp.asarray([[spec.count < spec.size] for spec in specs])
+
+    # 初始迭代相位：同GSiteration
+    phase = xp.fft.ifftshift(_keepDtype(xp, engine.ifft2(targets), complexDtype), axes=(-2, -1))
+    u = xp.real(xp.cos(phase)) + 1j * xp.real(xp.sin(phase))
+    targetU = amplitude
+
+    # 仍在迭代的帧(原始帧序号)
+    active = np.arange(frameNum)
+    outPhase = xp.empty((frameNum, height, width), dtype=realDtype)
+    outIntensity = xp.empty((frameNum, height, width), dtype=realDtype)
+
+    for n in range(maxIterNum):
+        if n > 0:
+            u = _polar(xp, None, phase)
+        activeNum = active.shape[0]
+
+        # 正向传播(未移位顺序，见GSiteration的shiftFree)
+        u = _keepDtype(xp, engine.fft2(u), complexDtype)
+
+        intensity = xp.abs(u) ** 2
+        flatIntensity = xp.reshape(intensity, (activeNum, -1))
+        maxI = xp.max(flatIntensity, axis=1, keepdims=True)
+        minI = xp.min(flatIntensity, axis=1, keepdims=True)
+        trapU = xp.take_along_axis(xp.reshape(u, (activeNum, -1)), indices, axis=1)
+        trapIntensity = xp.take_along_axis(flatIntensity, indices, axis=1)
+        normIntensity = (trapIntensity - minI) / (maxI - minI)
+
+        # 各帧均匀度
+        maxT = xp.max(trapIntensity, axis=1)
+        minT = xp.min(trapIntensity, axis=1)
+        uniformity = 1 - (maxT - minT) / (maxT + minT)
+
+        # 加权并逐帧归一化；归一化光强为0的光阱本次不更新权重，同GSiteration
+        weightedU = ((amplitude / xp.where(normIntensity > 0, normIntensity, amplitude)) ** 0.5) * targetU
+        maxW = xp.max(weightedU, axis=1, keepdims=True)
+        minW = xp.where(hasBackground, 0, xp.min(weightedU, axis=1, keepdims=True))
+        weightedU = (weightedU - minW) / (maxW - minW)
         targetU = weightedU
 
-        u.real = weightedU * cp.cos(phase)
-        u.imag = weightedU * cp.sin(phase)
+        u = xp.zeros((activeNum, height * width), dtype=complexDtype)
+        u[xp.reshape(xp.arange(activeNum), (-1, 1)), indices] = _polar(xp, weightedU, _angle(xp, trapU))
+        u = xp.reshape(u, (activeNum, height, width))
 
-        # 模拟透镜传递函数（向LCOS反向传播）
-        u = cp.fft.ifftshift(u)
-        u = cp.fft.ifft2(u)
-        # ---------------------------------
+        # 反向传播
+        u = _keepDtype(xp, engine.ifft2(u), complexDtype)
+        phase = _angle(xp, u)
 
-        phase = cp.angle(u)
+        # 每次迭代只同步一次整批的均匀度
+        uniformity = toHost(uniformity)
+        for k, frame in enumerate(active):
+            unfmLists[frame].append(float(uniformity[k]))
 
-        if uniformity >= uniThres:
+        done = uniformity >= uniThres
+        if n == maxIterNum - 1:
+            done[:] = True
+        if not done.any():
+            continue
+
+        # 输出已收敛的帧
+        finished = xp.asarray(np.flatnonzero(done))
+        frames = xp.asarray(active[done])
+        outPhase[frames] = xp.take(phase, finished, axis=0)
+        finishedIntensity = xp.take(intensity, finished, axis=0)
+        outIntensity[frames] = xp.fft.fftshift(
+            (finishedIntensity - xp.take(minI, finished, axis=0)[..., None])
+            / (xp.take(maxI - minI, finished, axis=0)[..., None]), axes=(-2, -1))
+
+        # 移出批次
+        active = active[~done]
+        if active.shape[0] == 0:
             break
+        remaining = xp.asarray(np.flatnonzero(~done))
+        phase = xp.take(phase, remaining, axis=0)
+        indices = xp.take(indices, remaining, axis=0)
+        amplitude = xp.take(amplitude, remaining, axis=0)
+        targetU = xp.take(targetU, remaining, axis=0)
+        hasBackground = xp.take(hasBackground, remaining, axis=0)
+
+    return (outPhase, outIntensity)
+
+
+# 光点域加权GS(GSW)算法相关
+def _trapBasis(xp, traps, shape, dtype):
+    """
+    各光阱在LCOS平面上的传播基 E_m(y, x) = Ey[m, y] * Ex[m, x]
+
+    光阱坐标(x, y)为目标图像(fftshift后焦平面)中的像素坐标，可为小数；
+    可选第三列z为离焦量，即在半径min(H, W)/2的孔径边缘引入z个波长的透镜相位
+
+    :return: Ey - (M, H)复数基, Ex - (M, W)复数基
+    """
+    height, width = shape
+    traps = xp.asarray(traps, dtype=dtype)
+    # fftshift后图像中心(H//2, W//2)对应零频
+    kx = traps[:, 0:1] - width // 2
+    ky = traps[:, 1:2] - height // 2
+    nx = xp.reshape(xp.arange(width, dtype=dtype), (1, -1))
+    ny = xp.reshape(xp.arange(height, dtype=dtype), (1, -1))
+    phaseX = 2 * xp.pi * kx * nx / width
+    phaseY = 2 * xp.pi * ky * ny / height
+
+    if traps.shape[1] > 2:
+        radius = min(height, width) / 2
+        z = traps[:, 2:3]
+        phaseX = phaseX + 2 * xp.pi * z * ((nx - width / 2) / radius) ** 2
+        phaseY = phaseY + 2 * xp.pi * z * ((ny - height / 2) / radius) ** 2
+
+    return _polar(xp, None, phaseY), _polar(xp, None, phaseX)
+
+
+def _trapField(xp, u, Ey, Ex):
+    # 各光阱处的复振幅 V_m = sum(u * conj(E_m))，按可分离基分两次矩阵乘法，O(M·H·W)
+    return xp.sum(xp.matmul(xp.conj(Ey), u) * xp.conj(Ex), axis=1)
+
+
+def _superpose(xp, coeff, Ey, Ex):
+    # 各光阱基的叠加 sum(coeff_m * E_m)
+    return xp.matmul(xp.matrix_transpose(Ey) if hasattr(xp, "matrix_transpose") else Ey.T,
+                     xp.reshape(coeff, (-1, 1)) * Ex)
+
+
+def GSWspots(maxIterNum: int, uniThres: float, traps, shape, unfmList: list, amplitudes=None, backend=None,
+             fft=None, precision="double", checkEvery=1):
+    """
+    光点域加权GS算法(GSW)：直接以光阱坐标为目标，每次迭代只计算M个光阱处的光场，代价O(M·像素数)，
+    适用于稀疏点阵目标
+
+    :param int maxIterNum: 最大迭代次数
+    :param float uniThres: 迭代目标（均匀性）
+    :param ndarray traps: 光阱坐标(M, 2)或(M, 3)，各行为(x, y[, z])，x/y为目标图像中的像素坐标
+    :param tuple shape: 全息图尺寸(H, W)
+    :param list unfmList: 均匀性记录
+    :param ndarray amplitudes: 各光阱目标振幅(M,)，None时均为1
+    :param str|module backend: 计算后端，见GSiteration
+    :param str|FFTEngine fft: 输出归一化光强时使用的FFT引擎，见getFFTEngine
+    :param str precision: 计算精度，"double"或"single"
+    :param int checkEvery: 每隔多少次迭代检查一次收敛，见GSiteration
+    :return: phase - 相位, normIntensity - 归一化光强
+    """
+    solver = SpotSolver(traps, shape, maxIterNum, uniThres, amplitudes, backend, fft, precision, checkEvery)
+    phase = solver.solve(unfmList)
+    return (phase, solver.normIntensity())
+
+
+class SpotSolver:
+    """
+    有状态的GSW求解器：保存光阱坐标、传播基、权重与当前相位。光阱增删或移动时只重算变化光阱的传播基，
+    并从当前相位与权重出发做少量迭代精修，精修未达到完整求解的均匀性(容差内)时退回完整求解
+
+    :ivar list latencies: 各次update的耗时(s)
+    :ivar float solvedUniformity: 最近一次完整求解的均匀性
+    :ivar float uniformity: 当前相位的均匀性
+    """
+
+    def __init__(self, traps, shape, maxIterNum=100, uniThres=0.66, amplitudes=None, backend=None, fft=None,
+                 precision="double", checkEvery=1):
+        """
+        :param ndarray traps: 光阱坐标(M, 2)或(M, 3)，见GSWspots
+        :param tuple shape: 全息图尺寸(H, W)
+        :param int maxIterNum: 完整求解的最大迭代次数
+        :param float uniThres: 完整求解的迭代目标（均匀性）
+        :param ndarray amplitudes: 各光阱目标振幅(M,)，None时均为1
+        :param str|module backend: 计算后端，见GSiteration
+        :param str|FFTEngine fft: 输出归一化光强时使用的FFT引擎，见getFFTEngine
+        :param str precision: 计算精度
+        :param int checkEvery: 每隔多少次迭代检查一次收敛
+        """
+        self.xp = resolveBackend(backend, traps)
+        self.shape = tuple(shape)
+        self.maxIterNum = maxIterNum
+        self.uniThres = uniThres
+        self.fft = fft
+        self.realDtype, self.complexDtype = getDtypes(self.xp, precision)
+        self.checkEvery = checkEvery
+        # 拷贝一份，update中原地修改坐标时不影响调用方的数组
+        self.traps = _copy(self.xp, traps, self.realDtype)
+        self.Ey, self.Ex = _trapBasis(self.xp, self.traps, self.shape, self.realDtype)
+        self.amplitudes = self._amplitudes(amplitudes, self.traps.shape[0])
+        self.weights = None
+        self.phase = None
+        self.solvedUniformity = None
+        self.uniformity = None
+        self.latencies = []
+
+    @property
+    def trapNum(self):
+        return self.traps.shape[0]
 
-    return (phase, normIntensity)
+    def _amplitudes(self, amplitudes, trapNum):
+        if amplitudes is None:
+            return self.xp.ones(trapNum, dtype=self.realDtype)
+        return _copy(self.xp, amplitudes, self.realDtype)
+
+    def _iterate(self, maxIterNum, uniThres, unfmList):
+        # 从当前相位与权重出发迭代，返回最后一次的均匀性(设备端)
+        xp = self.xp
+        history = []
+        phase, weights = self.phase, self.weights
+        uniformity = None
+
+        for n in range(maxIterNum):
+            # 光阱处光场
+            trapU = _trapField(xp, _polar(xp, None, phase), self.Ey, self.Ex)
+            trapAmp = xp.abs(trapU) / self.amplitudes
+
+            uniformity = _uniformity(xp, trapAmp ** 2)
+            history.append(uniformity)
+            if (n + 1) % self.checkEvery == 0 and bool(uniformity >= uniThres):
+                break
+
+            # 加权：光强偏弱的光阱提高权重
+            weights = weights * xp.mean(trapAmp) / trapAmp
+            weights = weights / xp.max(weights)
+            phase = _angle(xp, _superpose(xp, _polar(xp, weights * self.amplitudes, _angle(xp, trapU)),
+                                          self.Ey, self.Ex))
+
+        if unfmList is not None:
+            _syncHistory(xp, history, unfmList)
+        self.phase, self.weights = phase, weights
+        self.uniformity = None if uniformity is None else float(uniformity)
+        return self.uniformity
+
+    def solve(self, unfmList=None):
+        """
+        完整求解：各光阱以随机相位叠加(固定种子以保证可复现)作为初始相位
+
+        :param list unfmList: 均匀性记录
+        :return: phase - 相位
+        """
+        xp = self.xp
+        randPhase = xp.asarray(np.random.default_rng(0).uniform(-np.pi, np.pi, self.trapNum), dtype=self.realDtype)
+        self.weights = xp.ones(self.trapNum, dtype=self.realDtype)
+        self.phase = _angle(xp, _superpose(xp, _polar(xp, self.amplitudes, randPhase), self.Ey, self.Ex))
+        self.solvedUniformity = self._iterate(self.maxIterNum, self.uniThres, unfmList)
+        return self.phase
+
+    def _padTraps(self, traps):
+        # 统一新旧光阱坐标的列数(缺少z列时补0)
+        xp = self.xp
+        traps = xp.asarray(traps, dtype=self.realDtype)
+        if traps.ndim == 1:
+            traps = xp.reshape(traps, (1, -1))
+        columns = max(traps.shape[1], self.traps.shape[1])
+
+        def pad(arr):
+            if arr.shape[1] == columns:
+                return arr
+            zeros = xp.zeros((arr.shape[0], columns - arr.shape[1]), dtype=self.realDtype)
+            return _concat(xp, [arr, zeros], axis=1)
+
+        self.traps = pad(self.traps)
+        return pad(traps)
+
+    def update(self, add=None, move=None, remove=None, addAmplitudes=None, refineIterNum=10, tolerance=0.02,
+               unfmList=None):
+        """
+        增量更新光阱并精修，依次处理移动、删除、增加；移动与删除的序号均按更新前的序号，
+        新增光阱排在保留的光阱之后
+
+        :param ndarray add: 新增光阱坐标(K, 2)或(K, 3)
+        :param tuple move: (indices, traps)，移动的光阱序号(按更新前的序号)及新坐标
+        :param list remove: 删除的光阱序号(按更新前的序号)
+        :param ndarray addAmplitudes: 新增光阱的目标振幅，None时均为1
+        :param int refineIterNum: 精修的最大迭代次数
+        :param float tolerance: 允许精修结果低于完整求解均匀性的幅度
+        :param list unfmList: 均匀性记录
+        :return: phase - 相位
+        """
+        Tstart = time.time()
+        xp = self.xp
+        if self.phase is None:
+            self.solve(unfmList)
+            self.latencies.append(time.time() - Tstart)
+            return self.phase
+
+        if move is not None:
+            indices, traps = move
+            indices = np.asarray(indices).reshape(-1)
+            traps = self._padTraps(traps)
+            Ey, Ex = _trapBasis(xp, traps, self.shape, self.realDtype)
+            # 以take代替按索引赋值(Array API标准不支持)：移动的光阱取拼接在末尾的新坐标
+            order = np.arange(self.trapNum)
+            order[indices] = self.trapNum + np.arange(indices.shape[0])
+            order = xp.asarray(order)
+            self.traps = xp.take(_concat(xp, [self.traps, traps]), order, axis=0)
+            self.Ey = xp.take(_concat(xp, [self.Ey, Ey]), order, axis=0)
+            self.Ex = xp.take(_concat(xp, [self.Ex, Ex]), order, axis=0)
+            # 移动的光阱以现有平均权重起步
+            meanWeights = xp.ones(indices.shape[0], dtype=self.realDtype) * xp.mean(self.weights)
+            self.weights = xp.take(_concat(xp, [self.weights, meanWeights]), order, axis=0)
+
+        if remove is not None and len(remove) > 0:
+            keep = np.ones(self.trapNum, dtype=bool)
+            keep[np.asarray(remove)] = False
+            keep = xp.asarray(np.nonzero(keep)[0])
+            self.traps, self.Ey, self.Ex = (xp.take(arr, keep, axis=0) for arr in (self.traps, self.Ey, self.Ex))
+            self.amplitudes, self.weights = xp.take(self.amplitudes, keep), xp.take(self.weights, keep)
+
+        add = None if add is None else xp.asarray(add, dtype=self.realDtype)
+        if add is not None and add.shape[0] > 0:
+            traps = self._padTraps(add)
+            Ey, Ex = _trapBasis(xp, traps, self.shape, self.realDtype)
+            self.traps = _concat(xp, [self.traps, traps])
+            self.Ey, self.Ex = _concat(xp, [self.Ey, Ey]), _concat(xp, [self.Ex, Ex])
+            self.amplitudes = _concat(xp, [self.amplitudes, self._amplitudes(addAmplitudes, traps.shape[0])])
+            # 新光阱以现有平均权重起步
+            meanWeight = xp.mean(self.weights) if self.weights.shape[0] else xp.asarray(1, dtype=self.realDtype)
+            self.weights = _concat(xp, [self.weights, xp.ones(traps.shape[0], dtype=self.realDtype) * meanWeight])
+
+        if self.trapNum == 0:
+            raise ValueError("no traps left")
+
+        # 先以当前各光阱处光场的相位与现有权重直接重新叠加：新位置处光场近乎为0，若直接按GSW加权其权重会骤增
+        trapU = _trapField(xp, _polar(xp, None, self.phase), self.Ey, self.Ex)
+        self.phase = _angle(xp, _superpose(xp, _polar(xp, self.weights * self.amplitudes, _angle(xp, trapU)),
+                                           self.Ey, self.Ex))
+
+        # 从当前相位与权重精修，达到完整求解的均匀性(容差内)即停止，否则退回完整求解
+        uniformity = self._iterate(refineIterNum, self.solvedUniformity - tolerance, unfmList)
+        if uniformity < self.solvedUniformity - tolerance:
+            self.solve(unfmList)
+        self.latencies.append(time.time() - Tstart)
+        return self.phase
+
+    def normIntensity(self):
+        """
+        当前相位的全帧归一化光强(仅计算一次FFT)
+
+        :return: normIntensity - 归一化光强
+        """
+        xp = self.xp
+        engine = getFFTEngine(self.fft, xp)
+        u = xp.fft.fftshift(_keepDtype(xp, engine.fft2(_polar(xp, None, self.phase)), self.complexDtype))
+        return normalize(xp.abs(u) ** 2, xp)
+
+
+# 透镜-光栅叠加(Lenses and Gratings)算法相关
+def findTraps(targetImg):
+    """
+    提取目标图像中各光点(target == 1的连通域)的质心作为光阱坐标
+
+    :param ndarray|TargetSpec targetImg: 目标图像或目标描述
+    :return: traps - 光阱坐标(M, 2)，各行为(x, y)，主机端数组
+    """
+    if isinstance(targetImg, TargetSpec):
+        targetImg = targetImg.target
+    mask = (toHost(targetImg) == 1).astype(np.uint8)
+    _, _, _, centroids = cv2.connectedComponentsWithStats(mask)
+    # 第0个连通域为背景
+    return centroids[1:]
+
+
+def lgPhase(traps, shape, amplitudes=None, backend=None, precision="double"):
+    """
+    透镜-光栅叠加：各光阱的闪耀光栅(及透镜)相位以随机初相叠加，一次向量化计算得到相位，无需迭代
+
+    :param ndarray traps: 光阱坐标(M, 2)或(M, 3)，见GSWspots
+    :param tuple shape: 全息图尺寸(H, W)
+    :param ndarray amplitudes: 各光阱目标振幅(M,)，None时均为1
+    :param str|module backend: 计算后端
+    :param str precision: 计算精度
+    :return: phase - 相位, uniformity - 各光阱光强的均匀性
+    """
+    xp = resolveBackend(backend, traps)
+    realDtype, _ = getDtypes(xp, precision)
+    Ey, Ex = _trapBasis(xp, traps, shape, realDtype)
+    trapNum = Ey.shape[0]
+    if amplitudes is None:
+        amplitudes = xp.ones(trapNum, dtype=realDtype)
+    else:
+        amplitudes = xp.asarray(amplitudes, dtype=realDtype)
+
+    if trapNum == 1:
+        # 单个光阱即为闪耀光栅(及透镜)，相位可分离，直接按行列相加并折叠到[-pi, pi)，均匀性恒为1
+        phase = xp.reshape(_angle(xp, Ey[0]), (-1, 1)) + xp.reshape(_angle(xp, Ex[0]), (1, -1))
+        phase = xp.remainder(phase + xp.pi, 2 * xp.pi) - xp.pi
+        return phase, 1.0
+
+    randPhase = np.random.default_rng(0).uniform(-np.pi, np.pi, trapNum)
+    phase = _angle(xp, _superpose(xp, _polar(xp, amplitudes, xp.asarray(randPhase, dtype=realDtype)), Ey, Ex))
+
+    trapAmp = xp.abs(_trapField(xp, _polar(xp, None, phase), Ey, Ex)) / amplitudes
+    uniformity = float(_uniformity(xp, trapAmp ** 2))
+    return phase, uniformity
+
+
+def lgHologram(traps, shape, amplitudes=None, backend=None, precision="double"):
+    """
+    透镜-光栅叠加生成全息图
+
+    :param ndarray traps: 光阱坐标(M, 2)或(M, 3)，见GSWspots
+    :param tuple shape: 全息图尺寸(H, W)
+    :param ndarray amplitudes: 各光阱目标振幅(M,)，None时均为1
+    :param str|module backend: 计算后端
+    :param str precision: 计算精度
+    :return: holo - 全息图(同genHologram)
+    """
+    phase, _ = lgPhase(traps, shape, amplitudes, backend, precision)
+    return genHologram(phase)
+
+
+def autoSolve(maxIterNum: int, uniThres: float, targetImg, unfmList: list, maxTraps=4, solver=None, initPhase=None,
+              metrics=None):
+    """
+    自动选择求解方法：光阱(连通域)数不超过maxTraps且透镜-光栅叠加的均匀性达到uniThres时直接使用叠加结果，
+    否则使用GS迭代。光阱按质心处理为衍射极限光点
+
+    :param int maxIterNum: 最大迭代次数
+    :param float uniThres: 迭代目标（均匀性）
+    :param ndarray|TargetSpec targetImg: 目标图像或目标描述
+    :param list unfmList: 均匀性记录
+    :param int maxTraps: 使用透镜-光栅叠加的最大光阱数
+    :param HoloSolver solver: GS迭代使用的求解器，None时使用GSiteration
+    :param ndarray initPhase: GS迭代的初始相位
+    :param dict metrics: 求解指标记录，见HoloSolver.solve；透镜-光栅叠加时迭代数为0、效率为None
+    :return: phase - 相位, normIntensity - 归一化光强(透镜-光栅叠加时为None), method - "lg"或"gs"
+    """
+    traps = findTraps(targetImg)
+    if 0 < traps.shape[0] <= maxTraps:
+        xp = solver.xp if solver is not None else resolveBackend(None, getattr(targetImg, "target", targetImg))
+        precision = solver.precision if solver is not None else "double"
+        phase, uniformity = lgPhase(xp.asarray(traps), tuple(targetImg.shape), backend=xp, precision=precision)
+        if uniformity >= uniThres:
+            unfmList.append(uniformity)
+            if metrics is not None:
+                metrics.update(iterations=0, uniformity=[uniformity], efficiency=None)
+            return phase, None, "lg"
+
+    if solver is None:
+        phase, normIntensity = GSiteration(maxIterNum, uniThres, targetImg, unfmList, initPhase=initPhase,
+                                           metrics=metrics)
+    else:
+        phase, normIntensity = solver.solve(targetImg, unfmList, initPhase, metrics)
+    return phase, normIntensity, "gs"
 
 
 # 归一化
-def normalize(img):
-    maxI = cp.max(img)
-    minI = cp.min(img)
+def normalize(img, xp=None):
+    xp = xp or getArrayModule(img)
+    maxI = xp.max(img)
+    minI = xp.min(img)
 
     result = ((img - minI) / (maxI - minI))
 
@@ -125,23 +1604,308 @@ def normalize(img):
 
 
 # 生成全息图
-def genHologram(phase):
+def genHologram(phase, xp=None):
     """
     自相位生成全息图
 
-    :param cupy.core.core.ndarray phase: 输入相位
+    :param ndarray phase: 输入相位
+    :param module xp: 数组命名空间，None时自动推断
     :return: holo - 全息图
     """
+    xp = xp or getArrayModule(phase)
     # 相位校正，相位为负+2pi，为正保持原样
-    phase = cp.where(phase < 0, phase + 2 * cp.pi, phase)
-    holo = normalize(phase) * 255
-    holo = holo.astype("uint8")
+    phase = xp.where(phase < 0, phase + 2 * xp.pi, phase)
+    holo = normalize(phase, xp) * 255
+    holo = _astype(xp, holo, xp.uint8)
     return holo
 
 
 # 重建验证
-def reconstruct(normIntensity):
+def reconstruct(normIntensity, xp=None):
+    xp = xp or getArrayModule(normIntensity)
     rec = normIntensity * 255
-    rec = rec.astype("uint8")
+    rec = _astype(xp, rec, xp.uint8)
     return rec
 
+
+# 相位合成相关
+def _nollToNM(j):
+    # Noll序号 -> (n, m)，m为负表示sin项
+    n = 0
+    while (n + 1) * (n + 2) // 2 < j:
+        n += 1
+    k = j - n * (n + 1) // 2 - 1
+    m = n % 2 + 2 * ((k + (n + 1) % 2) // 2)
+    return n, (m if j % 2 == 0 or m == 0 else -m)
+
+
+class PhaseCompositor:
+    """
+    设备端相位合成器：按参数解析生成菲涅尔透镜、闪耀光栅与Zernike校正相位并按参数元组缓存，
+    与全息图相位相加后模2pi再量化为8位灰度(256级对应2pi，同原先uint8相加的回绕)。
+    透镜与Zernike以min(H, W)/2为单位半径、图像中心为原点(同GSWspots的z项)，在整帧上求值
+    """
+
+    def __init__(self, shape, backend=None, precision="double", maxCached=16):
+        """
+        :param tuple shape: 全息图尺寸(H, W)
+        :param str|module backend: 计算后端，见getBackend
+        :param str precision: 计算精度
+        :param int maxCached: 最多缓存的相位图数，超出时丢弃最早生成的
+        """
+        self.shape = tuple(shape)
+        self.xp = getBackend(backend)
+        self.realDtype, _ = getDtypes(self.xp, precision)
+        self.maxCached = maxCached
+        self._cache = {}
+
+    def _pattern(self, key, build):
+        pattern = self._cache.get(key)
+        if pattern is None:
+            pattern = build()
+            if len(self._cache) >= self.maxCached:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = pattern
+        return pattern
+
+    def _coords(self):
+        # 以单位半径归一化的中心坐标(1, W)与(H, 1)
+        def build():
+            xp = self.xp
+            height, width = self.shape
+            radius = min(height, width) / 2
+            x = (xp.arange(width, dtype=self.realDtype) - width / 2) / radius
+            y = (xp.arange(height, dtype=self.realDtype) - height / 2) / radius
+            return xp.reshape(x, (1, -1)), xp.reshape(y, (-1, 1))
+        return self._pattern(("coords",), build)
+
+    def lens(self, defocus):
+        """
+        菲涅尔透镜相位 2pi * defocus * rho^2
+
+        :param float defocus: 离焦量，单位半径处的波长数(正负决定会聚/发散)
+        :return: phase - 透镜相位(H, W)
+        """
+        def build():
+            x, y = self._coords()
+            return 2 * self.xp.pi * defocus * (x ** 2 + y ** 2)
+        return self._pattern(("lens", float(defocus)), build)
+
+    def grating(self, periodX=None, periodY=None):
+        """
+        闪耀光栅相位 2pi * (x / periodX + y / periodY)
+
+        :param float periodX: 沿x方向的周期(像素)，None时该方向无光栅
+        :param float periodY: 沿y方向的周期(像素)，None时该方向无光栅
+        :return: phase - 光栅相位(H, W)
+        """
+        def build():
+            xp = self.xp
+            height, width = self.shape
+            x = xp.reshape(xp.arange(width, dtype=self.realDtype), (1, -1))
+            y = xp.reshape(xp.arange(height, dtype=self.realDtype), (-1, 1))
+            phase = xp.zeros(self.shape, dtype=self.realDtype)
+            if periodX:
+                phase = phase + 2 * xp.pi * x / periodX
+            if periodY:
+                phase = phase + 2 * xp.pi * y / periodY
+            return phase
+        return self._pattern(("grating", periodX, periodY), build)
+
+    def zernike(self, coefficients):
+        """
+        Zernike像差校正相位(Noll序号，归一化使各项在单位圆上的均方根为1)
+
+        :param dict coefficients: {Noll序号: 系数(波长)}
+        :return: phase - 校正相位(H, W)
+        """
+        coefficients = tuple(sorted((int(j), float(c)) for j, c in dict(coefficients).items() if c))
+
+        def build():
+            xp = self.xp
+            x, y = self._coords()
+            rho = xp.sqrt(x ** 2 + y ** 2)
+            theta = xp.arctan2(y, x)
+            phase = xp.zeros(self.shape, dtype=self.realDtype)
+            for j, coefficient in coefficients:
+                n, m = _nollToNM(j)
+                radial = xp.zeros(self.shape, dtype=self.realDtype)
+                for s in range((n - abs(m)) // 2 + 1):
+                    radial = radial + ((-1) ** s * math.factorial(n - s)
+                                       / (math.factorial(s) * math.factorial((n + abs(m)) // 2 - s)
+                                          * math.factorial((n - abs(m)) // 2 - s))) * rho ** (n - 2 * s)
+                if m == 0:
+                    term = math.sqrt(n + 1) * radial
+                elif m > 0:
+                    term = math.sqrt(2 * (n + 1)) * radial * xp.cos(m * theta)
+                else:
+                    term = math.sqrt(2 * (n + 1)) * radial * xp.sin(-m * theta)
+                phase = phase + 2 * xp.pi * coefficient * term
+            return phase
+        return self._pattern(("zernike", coefficients), build)
+
+    def correction(self, lens=None, grating=None, zernike=None):
+        """
+        叠加的校正相位(按全部参数缓存)
+
+        :param float lens: 透镜离焦量，见lens，None时不加
+        :param tuple grating: 光栅周期(periodX, periodY)，见grating，None时不加
+        :param dict zernike: Zernike系数，见zernike，None时不加
+        :return: phase - 校正相位(H, W)，全部为None时返回None
+        """
+        key = ("correction", lens, tuple(grating) if grating else None,
+               tuple(sorted(dict(zernike).items())) if zernike else None)
+
+        def build():
+            patterns = []
+            if lens is not None:
+                patterns.append(self.lens(lens))
+            if grating:
+                patterns.append(self.grating(*grating))
+            if zernike:
+                patterns.append(self.zernike(zernike))
+            total = patterns[0]
+            for pattern in patterns[1:]:
+                total = total + pattern
+            return total
+
+        if lens is None and not grating and not zernike:
+            return None
+        return self._pattern(key, build)
+
+    def compose(self, phase, lens=None, grating=None, zernike=None):
+        """
+        全息图相位与校正相位相加，模2pi后量化为8位灰度
+
+        :param ndarray phase: 全息图相位(计算后端)
+        :param float lens: 见correction
+        :param tuple grating: 见correction
+        :param dict zernike: 见correction
+        :return: holo - 合成全息图(uint8)
+        """
+        xp = self.xp
+        correction = self.correction(lens, grating, zernike)
+        total = phase if correction is None else phase + correction
+        level = xp.floor(xp.remainder(total, 2 * xp.pi) * (256 / (2 * xp.pi)))
+        # 舍入误差使remainder结果恰为2pi时回绕到0
+        level = xp.remainder(level, 256)
+        return _astype(xp, level, xp.uint8)
+
+    def clear(self):
+        """
+        清空缓存的相位图
+        """
+        self._cache.clear()
+
+
+# 全息图磁盘缓存相关
+class HoloCache:
+    """
+    内容寻址的全息图磁盘缓存：以目标图像字节与求解参数的SHA-256为键，每项为一个npz文件(float32相位与评价指标)，
+    读取时刷新文件修改时间，写入后按修改时间从旧到新淘汰(LRU)，使总大小不超过maxBytes
+    """
+
+    def __init__(self, cacheDir=None, maxBytes=2 * 2 ** 30):
+        """
+        :param str cacheDir: 缓存目录，None时为~/.cache/libhologpu/holograms
+        :param int maxBytes: 缓存总大小上限(字节)
+        """
+        self.cacheDir = cacheDir or os.path.join(os.path.expanduser("~"), ".cache", "libhologpu", "holograms")
+        self.maxBytes = maxBytes
+        os.makedirs(self.cacheDir, exist_ok=True)
+
+    def key(self, targetImg, **params):
+        """
+        缓存键
+
+        :param ndarray|TargetSpec targetImg: 目标图像或目标描述
+        :param params: 影响结果的求解参数(如maxIterNum、uniThres、algorithm、precision)
+        :return: key - 十六进制摘要
+        """
+        if isinstance(targetImg, TargetSpec):
+            targetImg = targetImg.target
+        target = np.ascontiguousarray(toHost(targetImg))
+        digest = hashlib.sha256()
+        digest.update(repr((target.shape, target.dtype.str, sorted(params.items()))).encode())
+        digest.update(target.tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cacheDir, f"{key}.npz")
+
+    def get(self, key, xp=None):
+        """
+        查询缓存
+
+        :param str key: 缓存键
+        :param module xp: 返回相位所在的数组命名空间，None时为NumPy
+        :return: (phase, metrics)，未命中时为None；metrics为写入时的指标字典
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                phase = data["phase"]
+                metrics = {name[len("metric_"):]: data[name] for name in data.files if name.startswith("metric_")}
+        except Exception:
+            # 损坏的缓存项(如断电后长度为0的文件、不完整的zip)视为未命中并删除
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        # 刷新修改时间作为最近访问时间
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        metrics = {name: value.tolist() for name, value in metrics.items()}
+        return (phase if xp is None else xp.asarray(phase)), metrics
+
+    def put(self, key, phase, **metrics):
+        """
+        写入缓存并按大小上限淘汰
+
+        :param str key: 缓存键
+        :param ndarray phase: 相位(可为设备端数组)，以float32保存
+        :param metrics: 评价指标(标量或序列，如uniformity、efficiency)，值为None的项不保存
+        """
+        arrays = {f"metric_{name}": np.asarray(value) for name, value in metrics.items() if value is not None}
+        path = self._path(key)
+        tmpPath = f"{path}.{os.getpid()}.tmp"
+        with open(tmpPath, "wb") as f:
+            np.savez(f, phase=toHost(phase).astype(np.float32, copy=False), **arrays)
+        # 先写临时文件再替换，避免其他进程读到不完整的文件
+        os.replace(tmpPath, path)
+        self.evict()
+
+    def evict(self):
+        """
+        按修改时间从旧到新删除缓存项，直至总大小不超过maxBytes
+        """
+        entries = []
+        for name in os.listdir(self.cacheDir):
+            if not name.endswith(".npz"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cacheDir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(os.path.join(self.cacheDir, name))
+            except OSError:
+                continue
+            total -= size
+
+    @property
+    def totalBytes(self):
+        """
+        缓存当前总大小(字节)
+        """
+        return sum(entry.stat().st_size for entry in os.scandir(self.cacheDir) if entry.name.endswith(".npz"))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# 全息图视频播放窗口(PyQt5)，与计算部分分离，批量运行时无需导入GUI库
+
+import cv2
+
+from PyQt5.QtWidgets import QMainWindow, QLabel
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QPixmap, QImage
+
+
+# 窗体类
+class VideoPlayer(QMainWindow):
+    def __init__(self, video_path, fps):
+        super().__init__()
+
+        self.video_path = video_path
+        self.fps = fps
+
+        self.initUI()
+
+    def initUI(self):
+        # 创建标签用于显示图像
+        self.video_label = QLabel(self)
+        self.video_label.setAlignment(Qt.AlignCenter)
+        self.setCentralWidget(self.video_label)
+
+        # 创建窗口
+        self.setWindowTitle('Video Player')
+        # self.setGeometry(10, 50, 1920 - 20, 1080 - 120)
+        self.showMaximized()
+
+        self.playVid()
+
+    def playVid(self):
+        self.cap = cv2.VideoCapture(self.video_path)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.updateFrame)
+        self.timer.start(int(1000/self.fps))
+
+    def updateFrame(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            self.timer.stop()
+            self.cap.release()
+            self.showLastFrame()
+        else:
+            QFrame = self.cvtFrame2Qimg(frame)
+            self.video_label.setPixmap(QPixmap.fromImage(QFrame))
+
+    def showLastFrame(self):
+        _, last_frame = self.cap.read()
+        if last_frame is not None:
+            QFrame = self.cvtFrame2Qimg(last_frame)
+            self.video_label.setPixmap(QPixmap.fromImage(QFrame))
+
+    def cvtFrame2Qimg(self, frame):
+        height, width, channel = frame.shape
+        bytes_per_line = 3 * width
+        return QImage(frame.data, width, height, bytes_per_line, QImage.Format_RGB888)
+
+    def closeApp(self):
+        self.close()
@@ -0,0 +1,558 @@
+# -*- coding: utf-8 -*-
+# 视频逐帧生成全息图的流水线工具
+
+import contextlib
+import csv
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import subprocess
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import libhologpu as libholo
+
+
+class StageStats:
+    """
+    流水线阶段的忙碌时间统计(不含等待队列的时间)
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.busy = 0.0
+        self.items = 0
+
+    def add(self, seconds, items=1):
+        """
+        累计忙碌时间
+
+        :param float seconds: 耗时(s)
+        :param int items: 处理的项数
+        """
+        self.busy += seconds
+        self.items += items
+
+    @contextlib.contextmanager
+    def measure(self):
+        """
+        统计with块内的耗时为忙碌时间
+        """
+        Tstart = time.time()
+        try:
+            yield
+        finally:
+            self.add(time.time() - Tstart)
+
+    def occupancy(self, wallTime):
+        """
+        :param float wallTime: 流水线总耗时(s)
+        :return: occupancy - 忙碌时间占总耗时的比例
+        """
+        return self.busy / wallTime if wallTime > 0 else 0.0
+
+
+class PipelineStage(StageStats):
+    """
+    流水线工作线程：inQueue为None时为源阶段，反复调用func()直至返回None；
+    否则逐项从inQueue取出并调用func(item)，结果放入outQueue(为None时丢弃)。
+    结束(或出错)时向outQueue放入None作为结束标记，出错时check与join重新抛出异常；其他阶段出错时以stop提前结束
+    """
+
+    def __init__(self, name, func, inQueue=None, outQueue=None):
+        super().__init__(name)
+        self.func = func
+        self.inQueue = inQueue
+        self.outQueue = outQueue
+        self.error = None
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def _run(self):
+        try:
+            while True:
+                if self.inQueue is None:
+                    if self.stopping.is_set():
+                        break
+                    with self.measure():
+                        result = self.func()
+                    if result is None:
+                        self.items -= 1
+                        break
+                else:
+                    item = self.inQueue.get()
+                    if item is None:
+                        break
+                    if self.stopping.is_set():
+                        continue
+                    with self.measure():
+                        result = self.func(item)
+                if self.outQueue is not None:
+                    self.outQueue.put(result)
+        except BaseException as error:
+            self.error = error
+            # 出错后继续取空输入队列，避免上游阶段阻塞在已满的队列上
+            while self.inQueue is not None and self.inQueue.get() is not None:
+                pass
+        finally:
+            if self.outQueue is not None:
+                self.outQueue.put(None)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def join(self):
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def check(self):
+        """
+        工作线程已出错时立即抛出其异常，不等待线程结束，供主线程逐帧检查
+        """
+        if self.error is not None:
+            raise self.error
+
+    def stop(self):
+        """
+        提前结束并等待线程退出，不抛出异常：源阶段不再调用func，其余阶段丢弃尚未处理的项。
+        期间取空outQueue，使阻塞在已满队列上的线程得以退出
+        """
+        self.stopping.set()
+        sent = self.inQueue is None
+        while self.thread.is_alive():
+            if not sent:
+                try:
+                    self.inQueue.put_nowait(None)
+                    sent = True
+                except queue.Full:
+                    pass
+            while self.outQueue is not None:
+                try:
+                    self.outQueue.get_nowait()
+                except queue.Empty:
+                    break
+            self.thread.join(0.01)
+
+
+def boundedQueue(depth):
+    """
+    :param int depth: 队列容量，满时生产者阻塞
+    :return: queue.Queue
+    """
+    return queue.Queue(maxsize=depth)
+
+
+def occupancyReport(stages, wallTime):
+    """
+    各阶段占用率报告
+
+    :param list stages: StageStats列表
+    :param float wallTime: 流水线总耗时(s)
+    :return: report - 一行文本
+    """
+    return ", ".join(f"{stage.name} {stage.occupancy(wallTime) * 100:.1f}% ({stage.items} items, "
+                     f"{stage.busy:.2f}s)" for stage in stages)
+
+
+class FFmpegSink:
+    """
+    视频编码输出：8位灰度帧经stdin以rawvideo流式写入常驻ffmpeg进程，编码与计算并行，无需中间帧文件。
+    进程在写入首帧、确定尺寸时启动
+    """
+
+    def __init__(self, outputVid, fps, codec="libx264", crf=20, logFile=None, ffmpeg="ffmpeg"):
+        """
+        :param str outputVid: 输出视频文件
+        :param float fps: 帧率
+        :param str codec: 视频编码器
+        :param int crf: 码率控制
+        :param str logFile: ffmpeg控制台输出的日志文件，None时丢弃
+        :param str ffmpeg: ffmpeg可执行文件
+        """
+        self.outputVid = outputVid
+        self.fps = fps
+        self.codec = codec
+        self.crf = crf
+        self.logFile = logFile
+        self.ffmpeg = ffmpeg
+        self.process = None
+        self.log = None
+        self.shape = None
+        self.frames = 0
+
+    def _start(self, height, width):
+        cmd = [
+            self.ffmpeg,
+            "-y",                           # 默认覆盖已有文件
+            "-f", "rawvideo",               # 原始帧输入
+            "-pix_fmt", "gray",             # 8位灰度
+            "-s", f"{width}x{height}",      # 帧尺寸
+            "-r", str(self.fps),            # 帧率
+            "-i", "-",                      # 自stdin读取
+            "-c:v", self.codec,             # 编码器
+            "-crf", str(self.crf),          # 码率控制
+            "-pix_fmt", "yuv420p",          # 像素格式
+            self.outputVid
+        ]
+        if self.logFile is not None:
+            os.makedirs(os.path.dirname(self.logFile) or ".", exist_ok=True)
+            self.log = open(self.logFile, "w")
+        output = self.log if self.log is not None else subprocess.DEVNULL
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=output, stderr=output)
+        self.shape = (height, width)
+
+    def write(self, frame):
+        """
+        写入一帧
+
+        :param ndarray frame: 8位灰度帧(H, W)，各帧尺寸须一致
+        """
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if self.process is None:
+            self._start(*frame.shape)
+        elif frame.shape != self.shape:
+            raise ValueError(f"frame shape {frame.shape} does not match {self.shape}")
+        self.process.stdin.write(memoryview(frame))
+        self.frames += 1
+
+    def close(self):
+        """
+        结束输入并等待编码完成
+
+        :return: returncode - ffmpeg返回值，未写入任何帧时为None
+        """
+        if self.process is None:
+            return None
+        self.process.stdin.close()
+        returncode = self.process.wait()
+        if self.log is not None:
+            self.log.close()
+        self.process = None
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with code {returncode}, see {self.logFile}")
+        return returncode
+
+    def abort(self):
+        """
+        出错时终止ffmpeg进程，不完整的输出视频保留原样
+        """
+        if self.process is None:
+            return
+        try:
+            self.process.kill()
+            self.process.wait()
+            try:
+                self.process.stdin.close()
+            except OSError:
+                # 缓冲区中剩余的数据无法写入已终止的进程(BrokenPipeError)
+                pass
+        finally:
+            if self.log is not None:
+                self.log.close()
+            self.process = None
+
+
+class FrameJob:
+    """
+    可续算的逐帧作业：已完成帧的全息图依次追加到原始数据存档，帧号、指标与存档偏移追加到JSON Lines清单。
+    清单只在全息图落盘后写入，中断后重新打开即可跳过已完成的帧并继续追加
+    """
+
+    def __init__(self, jobDir, resume=True):
+        """
+        :param str jobDir: 作业目录
+        :param bool resume: 目录中已有清单时载入(否则清空重新开始)
+        """
+        self.jobDir = jobDir
+        self.manifestPath = os.path.join(jobDir, "manifest.jsonl")
+        self.storePath = os.path.join(jobDir, "holograms.raw")
+        os.makedirs(jobDir, exist_ok=True)
+        self.records = {}
+        manifestEnd, storeEnd = 0, 0
+        if resume and os.path.exists(self.manifestPath):
+            with open(self.manifestPath, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 中断时未写完的最后一行
+                        break
+                    manifestEnd += len(line)
+                    self.records[record["frame"]] = record
+                    storeEnd = max(storeEnd, record["offset"] + int(np.prod(record["shape"])))
+        # 截去中断时写了一半的数据，使偏移与清单一致
+        self.manifest = open(self.manifestPath, "ab")
+        self.manifest.truncate(manifestEnd)
+        self.store = open(self.storePath, "ab")
+        self.store.truncate(storeEnd)
+
+    def __contains__(self, frameNum):
+        return frameNum in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, frameNum, holo, **metrics):
+        """
+        记录一帧已完成
+
+        :param int frameNum: 帧号
+        :param ndarray holo: 8位全息图
+        :param metrics: 该帧指标(可JSON序列化)
+        """
+        holo = np.ascontiguousarray(holo, dtype=np.uint8)
+        offset = self.store.seek(0, os.SEEK_END)
+        self.store.write(memoryview(holo))
+        self.store.flush()
+        os.fsync(self.store.fileno())
+        record = {"frame": frameNum, "offset": offset, "shape": list(holo.shape), **metrics}
+        self.manifest.write(json.dumps(record).encode() + b"\n")
+        self.manifest.flush()
+        os.fsync(self.manifest.fileno())
+        self.records[frameNum] = record
+
+    def load(self, frameNum):
+        """
+        :param int frameNum: 已完成的帧号
+        :return: holo - 存档中的8位全息图
+        """
+        record = self.records[frameNum]
+        return np.fromfile(self.storePath, dtype=np.uint8, count=int(np.prod(record["shape"])),
+                           offset=record["offset"]).reshape(record["shape"])
+
+    def close(self):
+        self.manifest.close()
+        self.store.close()
+
+
+def _flattenRecord(record, prefix=""):
+    # 嵌套字典展开为"键.子键"
+    row = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            row.update(_flattenRecord(value, f"{prefix}{key}."))
+        else:
+            row[f"{prefix}{key}"] = value
+    return row
+
+
+class MetricsWriter(PipelineStage):
+    """
+    逐帧指标记录：记录经有界队列交由后台线程写出，格式按文件扩展名为CSV(.csv)、JSON Lines(.jsonl)或
+    Parquet(.parquet，需pyarrow，列式存储，关闭时一次写出)。嵌套字典展开为"键.子键"列；
+    CSV的列由首条记录确定，列表写为JSON字符串
+    """
+
+    FORMATS = (".csv", ".jsonl", ".parquet")
+
+    def __init__(self, path, depth=64):
+        """
+        :param str path: 输出文件
+        :param int depth: 队列容量
+        """
+        self.path = path
+        self.format = os.path.splitext(path)[1].lower()
+        if self.format not in self.FORMATS:
+            raise ValueError(f"unknown metrics format: {self.format}, expected one of {self.FORMATS}")
+        self.parquet = importlib.import_module("pyarrow.parquet") if self.format == ".parquet" else None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = None if self.parquet is not None else open(path, "w", newline="")
+        self.csvWriter = None
+        self.rows = []
+        super().__init__("metrics", self._write, inQueue=boundedQueue(depth))
+        self.start()
+
+    def _write(self, record):
+        row = _flattenRecord(record)
+        if self.format == ".jsonl":
+            self.file.write(json.dumps(row) + "\n")
+        elif self.format == ".csv":
+            if self.csvWriter is None:
+                self.csvWriter = csv.DictWriter(self.file, fieldnames=list(row), restval="", extrasaction="ignore")
+                self.csvWriter.writeheader()
+            self.csvWriter.writerow({key: json.dumps(value) if isinstance(value, (list, tuple)) else value
+                                     for key, value in row.items()})
+        else:
+            self.rows.append(row)
+
+    def write(self, **record):
+        """
+        提交一条记录(可JSON序列化的值，可含一层或多层嵌套字典)
+        """
+        self.inQueue.put(record)
+
+    def close(self):
+        """
+        等待已提交的记录写出并关闭文件，后台线程出错时在此抛出
+        """
+        self.inQueue.put(None)
+        try:
+            self.join()
+            if self.parquet is not None and self.rows:
+                table = importlib.import_module("pyarrow").Table.from_pylist(self.rows)
+                self.parquet.write_table(table, self.path)
+        finally:
+            if self.file is not None:
+                self.file.close()
+
+    def stop(self):
+        """
+        出错时结束：写出已提交的记录并关闭文件，不抛出异常
+        """
+        try:
+            self.close()
+        except Exception:
+            # 后台线程的异常不掩盖引发结束的异常
+            pass
+
+
+# 多进程求解相关
+# 工作进程内的共享内存视图与求解器
+_farmState = {}
+
+
+def _initFarmWorker(frameName, holoName, bufShape, solverOptions, warmStart, warmResetThres, threads):
+    # 各进程的FFT与Numba线程数限制为threads，避免进程数 x 核数的线程超额占用
+    if libholo.numba is not None:
+        libholo.numba.set_num_threads(threads)
+    engine = libholo.getFFTEngine(solverOptions.pop("fft", None), np, threads)
+    frameShm = shared_memory.SharedMemory(name=frameName)
+    holoShm = shared_memory.SharedMemory(name=holoName)
+    _farmState.update(
+        frameShm=frameShm,
+        holoShm=holoShm,
+        frames=np.ndarray(bufShape, dtype=np.uint8, buffer=frameShm.buf),
+        holos=np.ndarray(bufShape, dtype=np.uint8, buffer=holoShm.buf),
+        solver=libholo.HoloSolver(backend=np, fft=engine, copyOutput=False, **solverOptions),
+        warmStart=warmStart,
+        warmResetThres=warmResetThres,
+    )
+
+
+def _farmSolve(slot, count):
+    # 求解槽位slot中的count帧，全息图写回共享内存；同一块内的相邻帧按与串行求解相同的规则热启动
+    Tstart = time.time()
+    solver = _farmState["solver"]
+    frames, holos = _farmState["frames"], _farmState["holos"]
+    metrics = []
+    prevTarget, prevPhase = None, None
+    for i in range(count):
+        target = libholo.compileTarget(np.asarray(frames[slot, i] / 255, dtype=solver.realDtype), np)
+        initPhase = None
+        if (_farmState["warmStart"] and prevPhase is not None
+                and libholo.targetChange(target, prevTarget) <= _farmState["warmResetThres"]):
+            initPhase = prevPhase
+        frameMetrics = {}
+        phase, _ = solver.solve(target, None, initPhase, frameMetrics)
+        Tholo = time.time()
+        holos[slot, i] = libholo.genHologram(phase)
+        frameMetrics["timings"]["hologram"] = time.time() - Tholo
+        frameMetrics["warmStart"] = initPhase is not None
+        metrics.append(frameMetrics)
+        prevTarget, prevPhase = target, phase
+    return metrics, time.time() - Tstart
+
+
+class FrameFarm(StageStats):
+    """
+    多进程求解(NumPy后端)：8位灰度目标帧(阈值化后、归一化前)与全息图经共享内存槽位交换，不经pickle；
+    每个任务为一块连续的chunkSize帧，结果按帧序重排输出。忙碌时间为各进程求解耗时之和除以进程数
+    """
+
+    def __init__(self, shape, workers=None, chunkSize=4, warmStart=True, warmResetThres=0.5, threads=None,
+                 **solverOptions):
+        """
+        :param tuple shape: 帧尺寸(H, W)
+        :param int workers: 进程数，None时为CPU核数
+        :param int chunkSize: 每个任务的帧数，块内相邻帧可热启动，越大调度开销越小但负载越不均衡
+        :param bool warmStart: 块内以上一帧相位热启动
+        :param float warmResetThres: 前后帧光阱像素变化比例超过该值时冷启动，见targetChange
+        :param int threads: 每个进程的FFT与Numba线程数，None时为CPU核数 // 进程数(至少为1)
+        :param solverOptions: HoloSolver参数(maxIterNum、uniThres、fft、precision、checkEvery、fused等)
+        """
+        super().__init__("solve")
+        self.workers = workers or os.cpu_count()
+        self.threads = threads or max(1, os.cpu_count() // self.workers)
+        self.chunkSize = chunkSize
+        # 每个进程两个槽位，一个求解时另一个已填入下一块
+        self.slots = 2 * self.workers
+        self.bufShape = (self.slots, chunkSize) + tuple(shape)
+        size = int(np.prod(self.bufShape))
+        self.frameShm = shared_memory.SharedMemory(create=True, size=size)
+        self.holoShm = shared_memory.SharedMemory(create=True, size=size)
+        self.frames = np.ndarray(self.bufShape, dtype=np.uint8, buffer=self.frameShm.buf)
+        self.holos = np.ndarray(self.bufShape, dtype=np.uint8, buffer=self.holoShm.buf)
+        self.pool = multiprocessing.Pool(self.workers, initializer=_initFarmWorker,
+                                         initargs=(self.frameShm.name, self.holoShm.name, self.bufShape,
+                                                   solverOptions, warmStart, warmResetThres, self.threads))
+
+    def map(self, frames):
+        """
+        求解帧序列
+
+        :param iterable frames: 8位灰度目标帧(H, W)
+        :return: 生成器，按帧序逐帧产出(帧号, 全息图, 指标字典)，指标见HoloSolver.solve，耗时另含hologram，
+            另有warmStart(是否热启动)
+        """
+        frames = iter(frames)
+        free = list(range(self.slots))
+        pending = {}
+        chunkNum, nextChunk, frameNum = 0, 0, 0
+        exhausted = False
+
+        while True:
+            # 尽量填满空闲槽位并提交
+            while free and not exhausted:
+                slot = free.pop()
+                count = 0
+                for frame in frames:
+                    self.frames[slot, count] = frame
+                    count += 1
+                    if count == self.chunkSize:
+                        break
+                if count < self.chunkSize:
+                    exhausted = True
+                if count == 0:
+                    free.append(slot)
+                    break
+                pending[chunkNum] = (slot, count, self.pool.apply_async(_farmSolve, (slot, count)))
+                chunkNum += 1
+
+            if nextChunk not in pending:
+                return
+            # 按块序取回结果，其余块继续在后台求解
+            slot, count, result = pending.pop(nextChunk)
+            metrics, duration = result.get()
+            self.add(duration / self.workers, count)
+            for i in range(count):
+                yield frameNum, self.holos[slot, i].copy(), metrics[i]
+                frameNum += 1
+            free.append(slot)
+            nextChunk += 1
+
+    def close(self):
+        """
+        结束进程池并释放共享内存
+        """
+        self.pool.close()
+        self.pool.join()
+        self.frames = self.holos = None
+        for shm in (self.frameShm, self.holoShm):
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, *excInfo):
+        if excType is not None:
+            # 出错时不再等待尚未完成的块
+            self.pool.terminate()
+        self.close()
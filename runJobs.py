@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# 批量运行多个视频作业：python runJobs.py jobs.json
+# 作业列表为JSON数组，各项为showHolo的配置项(inputVid、outputVid、imgFold、fps、maxIterNum等)；
+# 也可为{"defaults": {...}, "jobs": [...]}，defaults中的配置作用于所有作业。未给出的项取showHolo中的默认值，
+# 相对路径相对于仓库根目录。所有作业在同一进程内依次执行，后端初始化、求解器工作区、FFT计划与内存池在作业间复用，
+# 不启动播放窗口
+
+import json
+import os
+import sys
+import time
+
+TimportStart = time.time()
+
+import showHolo
+from lib import libhologpu as libholo
+
+from colorama import init
+init(autoreset=True)
+
+# showHolo的配置项及其默认值
+defaults = {key: value for key, value in vars(showHolo).items()
+            if not key.startswith("_") and isinstance(value, (bool, int, float, str, type(None)))}
+
+
+def loadJobs(path):
+    """
+    读取作业列表
+
+    :param str path: JSON作业列表文件
+    :return: jobs - 配置字典列表
+    """
+    with open(path, encoding="utf-8") as f:
+        jobs = json.load(f)
+    if isinstance(jobs, dict):
+        jobs = [{**jobs.get("defaults", {}), **job} for job in jobs["jobs"]]
+
+    for k, job in enumerate(jobs):
+        unknown = sorted(set(job) - set(defaults))
+        if unknown:
+            raise ValueError(f"job {k}: unknown config {unknown}")
+        for key in ("inputVid", "outputVid"):
+            if key not in job:
+                raise ValueError(f"job {k}: missing {key}")
+    return jobs
+
+
+def runJob(k, job):
+    """
+    按配置执行一个作业，此前作业的配置不会保留
+
+    :param int k: 作业序号
+    :param dict job: 配置字典
+    """
+    for key, value in {**defaults, **job}.items():
+        setattr(showHolo, key, value)
+    # 未指定时各作业使用独立的帧文件夹与指标文件
+    name = f'{os.path.splitext(os.path.basename(job["inputVid"]))[0]}-{time.strftime("%Y%m%d%H%M%S")}-{k:03d}'
+    if "imgFold" not in job:
+        showHolo.imgFold = f'./frames/{name}/'
+    if "metricsFile" not in job:
+        showHolo.metricsFile = f'./log/metrics_{name}.jsonl'
+    # 保留内存池供后续作业复用
+    showHolo.releaseMemory = False
+
+    if showHolo.farmWorkers > 0:
+        showHolo.loopCalcHoloFarm()
+    else:
+        showHolo.loopCalcHoloGPU()
+    if not showHolo.streamVideo:
+        showHolo.createVidFromImgs()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python runJobs.py jobs.json")
+        sys.exit(2)
+
+    jobs = loadJobs(sys.argv[1])
+    # 相对路径与showHolo一致，相对于仓库根目录
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    print(f"Startup: {round(time.time() - TimportStart, 2)}s, jobs: {len(jobs)}")
+
+    durations = []
+    failed = []
+    for k, job in enumerate(jobs):
+        print(f"\n\033[0;34mJob {k}: {job['inputVid']} -> {job['outputVid']}\033[0m")
+        Tstart = time.time()
+        try:
+            runJob(k, job)
+        except (Exception, SystemExit) as error:
+            # 单个作业失败(如无法打开输入视频)不影响后续作业
+            print(f"\033[0;31mJob {k} failed: {error!r}\033[0m")
+            failed.append(k)
+        durations.append(time.time() - Tstart)
+        print(f"\033[0;34mJob {k} duration: {round(durations[-1], 2)}s\033[0m")
+
+    libholo.freeMemory()
+    print(f"\n\033[0;34mJobs: {len(jobs)}, failed: {failed}, total duration: {round(sum(durations), 2)}s\033[0m")
+    sys.exit(1 if failed else 0)
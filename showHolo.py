@@ -1,15 +1,15 @@
+import collections
+import hashlib
+import itertools
 import os
 import sys
 import time
 import subprocess
 
 import cv2
-import cupy as cp
+import numpy as np
 from lib import libhologpu as libholo
-
-from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QPixmap, QImage
+from lib import libholovid
 
 from colorama import init
 init(autoreset=True)
@@ -20,6 +20,33 @@ uniThres = 0.66             # 均匀度阈值
 fps = 5.0                  # 输出视频帧率
 codec = "libx264"           # 视频编码器
 crf = 20                    # 视频码率
+backend = "cupy"            # 计算后端("cupy"/"numpy")
+fftEngine = "auto"          # FFT引擎("auto"/"native"/"scipy"/"pyfftw")
+precision = "double"        # 计算精度("double"/"single")
+checkEvery = 1              # 每隔多少次迭代检查一次收敛(减少设备同步)
+fusedKernels = False        # 使用Numba融合核(仅numpy后端)
+batchSize = 1               # 批量求解的帧数(>1时使用GSiterationBatch)
+warmStart = True            # 以上一帧收敛相位作为初始相位(仅batchSize=1)
+warmResetThres = 0.5        # 前后帧光阱像素变化比例超过该值时重新冷启动
+skipDuplicates = True       # 与上一求解帧完全相同(哈希一致)时沿用其结果，不再求解(仅batchSize=1)
+duplicateThres = 0.0        # 光阱像素变化比例不超过该值时视为近似重复帧，同样沿用结果(0为仅跳过完全相同的帧)
+lgMaxTraps = 0              # 光阱数不超过该值时使用透镜-光栅叠加(仅batchSize=1，0为禁用)
+useCache = False            # 求解前查询全息图磁盘缓存，冷启动求解的结果写入缓存(仅batchSize=1)
+trajectoryMode = False      # 本帧为参考帧(上次求解的帧)的平移时叠加光栅相位，无需求解(仅batchSize=1)
+trajectoryTol = 0.0         # 判断平移时允许的光阱像素变化比例
+cacheDir = None             # 缓存目录，None时为~/.cache/libhologpu/holograms
+cacheMaxBytes = 2 * 2 ** 30  # 缓存总大小上限(字节)
+queueDepth = 8              # 解码->求解、求解->写图队列的容量(帧)
+streamVideo = True          # 将全息图帧经管道直接送入ffmpeg编码(否则先写TIFF再合并)
+saveFrames = False          # 流式编码时是否同时写出TIFF帧
+farmWorkers = 0             # 多进程求解的进程数(仅CPU，>0时启用，不使用缓存/轨迹/透镜-光栅等单帧功能)
+farmChunkSize = 4           # 多进程求解时每个任务的帧数(块内热启动)
+farmThreads = None          # 多进程求解时每个进程的FFT/Numba线程数，None时为CPU核数 // 进程数
+jobDir = None               # 作业目录(帧、完成清单与全息图存档)，设定后帧写入其中且中断后可续算
+resume = True               # 作业目录中已有清单时跳过已完成的帧，否则从头开始
+metricsFile = f'./log/metrics_{time.strftime("%Y%m%d%H%M%S")}.jsonl'  # 逐帧指标文件(.csv/.jsonl/.parquet)，None时不记录
+printFrames = False         # 逐帧在控制台打印一行指标摘要
+releaseMemory = True        # 结束时释放后端内存池(批量运行时保留，供后续作业复用)
 
 # 输入视频文件
 inputVid = './vids/output_gauss-squre-r10.avi'
@@ -31,129 +58,509 @@ imgFold = f'./frames/gauss-squre-r10-{time.strftime("%Y%m%d%H%M%S")}/'
 outputVid = './vids/gaussphasevid-squre-r10-fps5.mp4'
 
 
-# 窗体类
-class VideoPlayer(QMainWindow):
-    def __init__(self, video_path):
-        super().__init__()
-
-        self.video_path = video_path
+def readFrame(cap):
+    """
+    读取一帧并转换为阈值化的8位灰度图像
 
-        self.initUI()
+    :param cv2.VideoCapture cap: 输入视频
+    :return: frame - 8位灰度图像，视频结束时为None
+    """
+    ret, frame = cap.read()
 
-    def initUI(self):
-        # 创建标签用于显示图像
-        self.video_label = QLabel(self)
-        self.video_label.setAlignment(Qt.AlignCenter)
-        self.setCentralWidget(self.video_label)
+    if not ret:
+        return None
 
-        # 创建窗口
-        self.setWindowTitle('Video Player')
-        # self.setGeometry(10, 50, 1920 - 20, 1080 - 120)
-        self.showMaximized()
+    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-        self.playVid()
+    # 阈值化
+    gray_frame[gray_frame > 150] = 255
+    return gray_frame
 
-    def playVid(self):
-        self.cap = cv2.VideoCapture(self.video_path)
 
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.updateFrame)
-        self.timer.start(int(1000/fps))
+def readTarget(cap):
+    """
+    读取一帧并转换为归一化目标图像
 
-    def updateFrame(self):
-        ret, frame = self.cap.read()
-        if not ret:
-            self.timer.stop()
-            self.cap.release()
-            self.showLastFrame()
-        else:
-            QFrame = self.cvtFrame2Qimg(frame)
-            self.video_label.setPixmap(QPixmap.fromImage(QFrame))
+    :param cv2.VideoCapture cap: 输入视频
+    :return: target - 目标图像，视频结束时为None
+    """
+    frame = readFrame(cap)
 
-    def showLastFrame(self):
-        _, last_frame = self.cap.read()
-        if last_frame is not None:
-            QFrame = self.cvtFrame2Qimg(last_frame)
-            self.video_label.setPixmap(QPixmap.fromImage(QFrame))
+    if frame is None:
+        return None
 
-    def cvtFrame2Qimg(self, frame):
-        height, width, channel = frame.shape
-        bytes_per_line = 3 * width
-        return QImage(frame.data, width, height, bytes_per_line, QImage.Format_RGB888)
+    # 归一化
+    return frame / 255
 
-    def closeApp(self):
-        self.close()
 
+def writeHolo(item, sink=None, job=None, cache=None):
+    """
+    旋转并写出一帧全息图，写出后记入作业清单并写入缓存
 
-def loopCalcHoloGPU():
+    :param tuple item: (帧号, 全息图, 指标字典[, 缓存项])，全息图为None表示续算时已完成的帧；
+        缓存项为(缓存键, 相位, 指标字典)，None时不写入
+    :param libholovid.FFmpegSink sink: 视频编码输出，None时只写TIFF
+    :param libholovid.FrameJob job: 作业记录，None时不记录
+    :param libholo.HoloCache cache: 全息图缓存
     """
-    自动态路径视频生成全息图
+    frameNum, holo, metrics = item[:3]
+    if holo is None:
+        # 已完成的帧：TIFF已存在，自存档读取全息图送入视频编码
+        if sink is not None:
+            sink.write(cv2.rotate(job.load(frameNum), cv2.ROTATE_90_CLOCKWISE))
+        return
+    rotated = cv2.rotate(holo, cv2.ROTATE_90_CLOCKWISE)
+    if sink is not None:
+        sink.write(rotated)
+    if sink is None or saveFrames:
+        cv2.imwrite(f"{imgFold}{imgName}-{frameNum:03d}.tif", rotated)
+    if job is not None:
+        job.append(frameNum, holo, **metrics)
+    if cache is not None and len(item) > 3 and item[3] is not None:
+        cacheKey, phase, cacheMetrics = item[3]
+        cache.put(cacheKey, phase, **cacheMetrics)
+
+
+def frameRecord(source, uniformity, efficiency=None, iterations=0, warm=False, timings=None, allocatedBytes=None):
     """
-    cap = cv2.VideoCapture(inputVid)
+    构建一帧的指标记录，各帧字段一致(CSV的列由首条记录确定)
+
+    :param str source: 结果来源，"gs"/"lg"/"batch"(求解)或"cache"/"shift"/"duplicate"(沿用)
+    :param list uniformity: 均匀性记录(沿用时为原求解的记录)
+    :param float efficiency: 效率
+    :param int iterations: 本帧的迭代数，沿用结果时为0
+    :param bool warm: 是否热启动
+    :param dict timings: 各阶段耗时(s)，见HoloSolver.solve，另含hologram(生成全息图)与total(本帧总计)
+    :param int allocatedBytes: 本帧求解中新分配的字节数
+    :return: record - 指标字典
+    """
+    return {
+        "source": source,
+        "iterations": iterations,
+        "uniformity": uniformity[-1],
+        "efficiency": efficiency,
+        "warmStart": warm,
+        "timings": {"setup": None, "iterate": None, "finalize": None, "hologram": None, "total": None,
+                    **(timings or {})},
+        "allocatedBytes": allocatedBytes,
+        "uniformityHistory": list(uniformity),
+    }
+
+
+def reportFrame(metricsWriter, frameNum, record):
+    """
+    输出一帧的指标：写入指标文件，printFrames时同时打印一行摘要
 
-    if not cap.isOpened():
-        print("Cannot open video file")
-        exit()
+    :param libholovid.MetricsWriter metricsWriter: 指标输出，None时不记录
+    :param int frameNum: 帧号
+    :param dict record: 指标记录，见frameRecord
+    """
+    if metricsWriter is not None:
+        metricsWriter.write(frame=frameNum, **record)
+    if printFrames:
+        efficiency = "-" if record["efficiency"] is None else round(record["efficiency"], 4)
+        print(f"Frame {frameNum}: {record['source']}, iterations={record['iterations']}, "
+              f"uniformity={round(record['uniformity'], 4)}, efficiency={efficiency}, "
+              f"{round(record['timings']['total'], 3)}s")
 
-    if os.path.exists(imgFold):
-        pass
-    else:
-        os.makedirs(imgFold)
 
-    uniformity = []
-    frameNum = 0
+def openJob():
+    """
+    打开作业目录，帧输出改至其下的frames文件夹
+
+    :return: job - libholovid.FrameJob，未设定jobDir时为None
+    """
+    global imgFold
+    if jobDir is None:
+        return None
+    imgFold = os.path.join(jobDir, "frames", "")
+    job = libholovid.FrameJob(jobDir, resume)
+    if len(job):
+        print(f"Resuming job {jobDir}: {len(job)} frames already finished")
+    return job
+
 
-    # 逐帧读取视频并执行操作
-    while True:
-        ret, frame = cap.read()
+def checkPipeline(stages):
+    """
+    逐帧检查工作线程，任一线程(解码、写图、指标记录)出错时立即抛出其异常，不再继续求解
 
-        if not ret:
-            break
+    :param list stages: libholovid.PipelineStage列表，可含None
+    """
+    for stage in stages:
+        if stage is not None:
+            stage.check()
 
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-        target = gray_frame
-        # 阈值化
-        target[target > 150] = 255
-        # 归一化
-        target = target / 255
+def stopPipeline(stages, sink=None, job=None, metricsWriter=None):
+    """
+    出错或中断时结束流水线：终止ffmpeg，停止工作线程，关闭作业与指标记录，不留下运行中的线程。
+    各步骤出错时仍继续其余步骤
 
-        # -----开始计时-----
-        Tstart = time.time()
+    :param list stages: libholovid.PipelineStage列表，可含None(尚未创建)
+    :param libholovid.FFmpegSink sink: 视频输出
+    :param libholovid.FrameJob job: 作业
+    :param libholovid.MetricsWriter metricsWriter: 指标输出
+    """
+    # 先终止ffmpeg，使阻塞在管道写入上的写图线程得以退出
+    steps = []
+    if sink is not None:
+        steps.append(sink.abort)
+    steps.extend(stage.stop for stage in stages if stage is not None)
+    if job is not None:
+        steps.append(job.close)
+    if metricsWriter is not None:
+        steps.append(metricsWriter.stop)
+    for step in steps:
+        try:
+            step()
+        except Exception:
+            # 不掩盖引发结束的异常
+            pass
+
+
+# 求解器(工作区与FFT计划)在同一进程的多次loopCalcHoloGPU调用间复用
+_solvers = {}
+
+
+def getLoopSolver(xp):
+    """
+    获取当前配置下的求解器，迭代参数每次按配置更新
 
-        # CuPy类型转换(NumPy->CuPy)
-        target = cp.asarray(target)
+    :param module xp: 计算后端
+    :return: libholo.HoloSolver
+    """
+    key = (xp.__name__, fftEngine, precision, fusedKernels)
+    solver = _solvers.get(key)
+    if solver is None:
+        # 工作区在各帧间复用，结果在下一帧求解前使用完毕，无需拷贝
+        solver = libholo.HoloSolver(backend=xp, fft=fftEngine, precision=precision, copyOutput=False,
+                                    fused=fusedKernels)
+        _solvers[key] = solver
+    solver.maxIterNum = maxIterNum
+    solver.uniThres = uniThres
+    solver.checkEvery = checkEvery
+    return solver
 
-        # 计算全息图
-        phase, normIntensity = libholo.GSiteration(maxIterNum, uniThres, target, uniformity)
-        holo = libholo.genHologram(phase)
 
-        # CuPy类型转换(CuPy->NumPy)
-        holo = cp.asnumpy(holo)
+def loopCalcHoloGPU():
+    """
+    自动态路径视频生成全息图：解码与写图在工作线程中进行，经有界队列与(主线程中的)求解衔接
+    """
+    cap = cv2.VideoCapture(inputVid)
 
-        # 写图
-        holo = cv2.rotate(holo, cv2.ROTATE_90_CLOCKWISE)
-        cv2.imwrite(f"{imgFold}{imgName}-{frameNum:03d}.tif", holo)
+    if not cap.isOpened():
+        print("Cannot open video file")
+        exit()
 
-        # -----结束计时-----
-        Tend = time.time()
+    decoder, writer, sink, job, metricsWriter = None, None, None, None, None
+    try:
+        job = openJob()
+        if (not streamVideo or saveFrames) and not os.path.exists(imgFold):
+            os.makedirs(imgFold)
+
+        xp = libholo.getBackend(backend)
+        realDtype, _ = libholo.getDtypes(xp, precision)
+        solver = getLoopSolver(xp)
+        cache = libholo.HoloCache(cacheDir, cacheMaxBytes) if useCache else None
+        frameNum = 0
+        # 热启动状态(上一个非重复帧的目标、相位、指标与哈希)与逐帧迭代数记录
+        prevTarget, prevPhase = None, None
+        prevUniformity, prevEfficiency, prevDigest = None, None, None
+        duplicateFrames, nearDuplicateFrames = 0, 0
+        iterCounts = []
+        warmFrames = 0
+        cacheHits = 0
+        resumedFrames = 0
+        # 轨迹模式的参考帧
+        refTarget, refPhase, refUniformity, refEfficiency = None, None, None, None
+        shiftedFrames = 0
+
+        # 指标记录先于流水线线程创建，格式不支持时不留下运行中的线程
+        metricsWriter = None if metricsFile is None else libholovid.MetricsWriter(metricsFile)
+
+        # 三级流水线：解码 -> 求解 -> 写图
+        frameQueue = libholovid.boundedQueue(queueDepth)
+        holoQueue = libholovid.boundedQueue(queueDepth)
+        decoder = libholovid.PipelineStage("decode", lambda: readTarget(cap), outQueue=frameQueue).start()
+        if streamVideo:
+            sink = libholovid.FFmpegSink(outputVid, int(fps), codec, crf,
+                                         logFile=f"./log/ffmpeg_log_{time.strftime('%Y%m%d%H%M%S')}.txt")
+        writer = libholovid.PipelineStage("write", lambda item: writeHolo(item, sink, job, cache),
+                                          inQueue=holoQueue).start()
+        solveStats = libholovid.StageStats("solve")
+        TpipeStart = time.time()
+
+        # 逐批读取视频并执行操作
+        finished = False
+        carry = None
+        while not finished:
+            checkPipeline([decoder, writer, metricsWriter])
+            targets = []
+            while len(targets) < batchSize:
+                if carry is not None:
+                    target, carry = carry, None
+                else:
+                    target = frameQueue.get()
+                if target is None:
+                    finished = True
+                    break
+                if job is not None and frameNum + len(targets) in job:
+                    if targets:
+                        # 先求解本批已读取的帧，保持写出顺序
+                        carry = target
+                        break
+                    # 续算时跳过已完成的帧
+                    holoQueue.put((frameNum, None, None))
+                    frameNum += 1
+                    resumedFrames += 1
+                    continue
+                targets.append(target)
+
+            if not targets:
+                break
+
+            # -----开始计时-----
+            Tstart = time.time()
+            cacheEntry = None
+
+            if batchSize == 1:
+                # 类型转换(NumPy->计算后端)，并构建本帧的目标描述
+                target = libholo.compileTarget(xp.asarray(targets[0], dtype=realDtype), xp)
+                uniformity = []
+                solveMetrics = {}
+                initPhase = None
+
+                # 首先检查重复帧：与上一个非重复帧哈希一致，或光阱像素变化不超过duplicateThres
+                duplicate = False
+                if skipDuplicates:
+                    digest = hashlib.blake2b(np.ascontiguousarray(targets[0]).data, digest_size=16).digest()
+                    if prevPhase is not None:
+                        if digest == prevDigest:
+                            duplicate = True
+                        elif duplicateThres > 0 and libholo.targetChange(target, prevTarget) <= duplicateThres:
+                            duplicate = True
+                            nearDuplicateFrames += 1
+
+                # 轨迹模式：本帧为参考帧的平移时，叠加闪耀光栅相位即得全息图，光强分布与指标同参考帧
+                offset = None
+                if trajectoryMode and refTarget is not None and not duplicate:
+                    offset = libholo.targetOffset(target, refTarget, trajectoryTol)
+
+                # 其次查询缓存，命中时直接使用缓存的相位与指标
+                cached = None
+                if offset is None and not duplicate and cache is not None:
+                    cacheKey = cache.key(targets[0], maxIterNum=maxIterNum, uniThres=uniThres, algorithm="wgs",
+                                         precision=precision, lgMaxTraps=lgMaxTraps, checkEvery=checkEvery,
+                                         fft=fftEngine, fused=fusedKernels)
+                    cached = cache.get(cacheKey, xp)
+
+                if duplicate:
+                    # 上一帧的相位仍在求解器工作区中(其后未再求解)，直接沿用
+                    phase = prevPhase
+                    uniformity.extend(prevUniformity)
+                    efficiency = prevEfficiency
+                    duplicateFrames += 1
+                    source = "duplicate"
+                elif offset is not None:
+                    phase = libholo.shiftPhase(refPhase, *offset)
+                    uniformity.extend(refUniformity)
+                    efficiency = refEfficiency
+                    shiftedFrames += 1
+                    source = "shift"
+                elif cached is not None:
+                    phase, cachedMetrics = cached
+                    uniformity.extend(cachedMetrics["uniformity"])
+                    efficiency = cachedMetrics.get("efficiency")
+                    cacheHits += 1
+                    source = "cache"
+                else:
+                    # 前后帧变化不大时以上一帧相位热启动
+                    if (warmStart and prevPhase is not None
+                            and libholo.targetChange(target, prevTarget) <= warmResetThres):
+                        initPhase = prevPhase
+                        warmFrames += 1
+
+                    # 计算全息图
+                    if lgMaxTraps > 0:
+                        phase, _, source = libholo.autoSolve(maxIterNum, uniThres, target, uniformity, lgMaxTraps,
+                                                             solver, initPhase, solveMetrics)
+                    else:
+                        phase, _ = solver.solve(target, uniformity, initPhase, solveMetrics)
+                        source = "gs"
+                    # 效率由求解器在设备端计算(透镜-光栅叠加时为None)
+                    efficiency = solveMetrics["efficiency"]
+                    # 热启动的结果依赖上一帧，不写入缓存；相位为求解器工作区，在此拷贝，写盘交由写图线程
+                    if cache is not None and initPhase is None:
+                        cacheEntry = (cacheKey, libholo.toHost(phase).astype(np.float32),
+                                      {"uniformity": list(uniformity), "efficiency": efficiency})
+                if trajectoryMode and offset is None and not duplicate:
+                    # 求解器结果为工作区数组，参考相位需单独保留
+                    refTarget, refPhase = target, libholo._copy(xp, phase)
+                    refUniformity, refEfficiency = list(uniformity), efficiency
+                # 近似重复帧不更新参考，避免缓慢漂移逐帧累积
+                if not duplicate:
+                    prevTarget, prevPhase = target, phase
+                    prevUniformity, prevEfficiency = list(uniformity), efficiency
+                    prevDigest = digest if skipDuplicates else None
+                phases, unfmLists, efficiencies = [phase], [uniformity], [efficiency]
+                records = [frameRecord(source, uniformity, efficiency, solveMetrics.get("iterations", 0),
+                                       initPhase is not None, solveMetrics.get("timings"),
+                                       solver.allocatedBytes if "timings" in solveMetrics else None)]
+            else:
+                # 批量计算全息图
+                targets = xp.asarray(np.stack(targets), dtype=realDtype)
+                unfmLists = [[] for _ in range(targets.shape[0])]
+                phases, normIntensities = libholo.GSiterationBatch(maxIterNum, uniThres, targets, unfmLists,
+                                                                   fft=fftEngine, precision=precision)
+                efficiencies = [libholo.efficiencyCalc(normIntensities[k], targets[k]) for k in range(len(unfmLists))]
+                records = [frameRecord("batch", unfmLists[k], efficiencies[k], len(unfmLists[k]))
+                           for k in range(len(unfmLists))]
+
+            # 生成全息图并转换类型(计算后端->NumPy)
+            Tholo = time.time()
+            holos = [libholo.toHost(libholo.genHologram(phases[k])) for k in range(len(unfmLists))]
+
+            # -----结束计时-----
+            Tend = time.time()
+            solveStats.add(Tend - Tstart, len(holos))
+
+            # 交由写图线程，指标交由指标记录线程
+            for k, holo in enumerate(holos):
+                records[k]["timings"].update(hologram=(Tend - Tholo) / len(holos), total=(Tend - Tstart) / len(holos))
+                holoQueue.put((frameNum, holo, records[k], cacheEntry))
+                reportFrame(metricsWriter, frameNum, records[k])
+                iterCounts.append(records[k]["iterations"])
+                frameNum += 1
+            del holos
+        # 解码线程出错时队列同样以结束标记收尾，在输出汇总前检查
+        checkPipeline([decoder, writer, metricsWriter])
+
+        if iterCounts:
+            print(f"\nFrames: {len(iterCounts)}, warm-started: {warmFrames}, cache hits: {cacheHits}, "
+                  f"phase-shifted: {shiftedFrames}, duplicates: {duplicateFrames} (near: {nearDuplicateFrames}), "
+                  f"resumed: {resumedFrames}, solves avoided: {cacheHits + shiftedFrames + duplicateFrames}, "
+                  f"mean iterations: {round(sum(iterCounts) / len(iterCounts), 2)}")
+            print(f"Iterations per frame: {iterCounts}")
+
+        # 等待写图完成，工作线程出错时在此抛出
+        holoQueue.put(None)
+        writer.join()
+        decoder.join()
+        if sink is not None:
+            sink.close()
+        if job is not None:
+            job.close()
+        if metricsWriter is not None:
+            metricsWriter.close()
+        print(f"Pipeline occupancy: "
+              f"{libholovid.occupancyReport([decoder, solveStats, writer], time.time() - TpipeStart)}")
+
+        # 释放资源并关闭窗口
+        if releaseMemory:
+            libholo.freeMemory(xp)
+    except BaseException:
+        stopPipeline([decoder, writer], sink, job, metricsWriter)
+        raise
+    finally:
+        cap.release()
+    cv2.destroyAllWindows()
 
-        frameNum += 1
 
-        # 性能
-        print(f"\033[0;32mFrameNum: {frameNum - 1}\033[0m")
-        print(f"Iteration: {len(uniformity)}")
-        print(f"Duration: {round(Tend - Tstart, 2)}s")
-        print(f"uniformity={round(uniformity[-1], 4)}")
-        efficiency = cp.sum(normIntensity[target == 1]) / cp.sum(target[target == 1])
-        print(f"efficiency={round(float(efficiency), 4)}")
+def loopCalcHoloFarm():
+    """
+    多进程求解(NumPy后端)：解码线程读帧，进程池经共享内存求解，结果按帧序交由写图线程
+    """
+    cap = cv2.VideoCapture(inputVid)
 
-        uniformity = []
-        del holo
+    if not cap.isOpened():
+        print("Cannot open video file")
+        exit()
 
-    # 释放资源并关闭窗口
-    cp._default_memory_pool.free_all_blocks()
-    cap.release()
+    decoder, writer, sink, job, metricsWriter = None, None, None, None, None
+    try:
+        job = openJob()
+        if (not streamVideo or saveFrames) and not os.path.exists(imgFold):
+            os.makedirs(imgFold)
+
+        metricsWriter = None if metricsFile is None else libholovid.MetricsWriter(metricsFile)
+        frameQueue = libholovid.boundedQueue(queueDepth)
+        holoQueue = libholovid.boundedQueue(queueDepth)
+        decoder = libholovid.PipelineStage("decode", lambda: readFrame(cap), outQueue=frameQueue).start()
+        if streamVideo:
+            sink = libholovid.FFmpegSink(outputVid, int(fps), codec, crf,
+                                         logFile=f"./log/ffmpeg_log_{time.strftime('%Y%m%d%H%M%S')}.txt")
+        writer = libholovid.PipelineStage("write", lambda item: writeHolo(item, sink, job), inQueue=holoQueue).start()
+        TpipeStart = time.time()
+
+        # 读入各帧的(帧号, 是否已完成)，已完成的帧不送入进程池，按此顺序穿插写出
+        order = collections.deque()
+
+        def frames():
+            frameNum = 0
+            while True:
+                frame = frameQueue.get()
+                if frame is None:
+                    return
+                finished = job is not None and frameNum in job
+                order.append((frameNum, finished))
+                if not finished:
+                    yield frame
+                frameNum += 1
+
+        def flushFinished():
+            nonlocal resumedFrames
+            while order and order[0][1]:
+                holoQueue.put((order.popleft()[0], None, None))
+                resumedFrames += 1
+
+        iterCounts = []
+        resumedFrames = 0
+        frameIter = frames()
+        first = next(frameIter, None)
+        # 首帧确定共享内存槽位尺寸
+        farm = None
+        if first is not None:
+            farm = libholovid.FrameFarm(first.shape, farmWorkers, farmChunkSize, warmStart, warmResetThres, farmThreads,
+                                        maxIterNum=maxIterNum, uniThres=uniThres, fft=fftEngine, precision=precision,
+                                        checkEvery=checkEvery, fused=fusedKernels)
+            with farm:
+                for _, holo, metrics in farm.map(itertools.chain([first], frameIter)):
+                    # 交由写图线程
+                    checkPipeline([decoder, writer, metricsWriter])
+                    flushFinished()
+                    frameNum = order.popleft()[0]
+                    timings = metrics["timings"]
+                    record = frameRecord("gs", metrics["uniformity"], metrics["efficiency"], metrics["iterations"],
+                                         metrics["warmStart"], {**timings, "total": sum(timings.values())})
+                    holoQueue.put((frameNum, holo, record))
+                    reportFrame(metricsWriter, frameNum, record)
+                    iterCounts.append(metrics["iterations"])
+        flushFinished()
+        checkPipeline([decoder, writer, metricsWriter])
+
+        if iterCounts:
+            print(f"\nFrames: {len(iterCounts)}, resumed: {resumedFrames}, "
+                  f"workers: {farm.workers}, chunk size: {farm.chunkSize}, "
+                  f"mean iterations: {round(sum(iterCounts) / len(iterCounts), 2)}")
+            print(f"Iterations per frame: {iterCounts}")
+
+        # 等待写图完成，工作线程出错时在此抛出
+        holoQueue.put(None)
+        writer.join()
+        decoder.join()
+        if sink is not None:
+            sink.close()
+        if job is not None:
+            job.close()
+        if metricsWriter is not None:
+            metricsWriter.close()
+        stages = [decoder, writer] if farm is None else [decoder, farm, writer]
+        print(f"Pipeline occupancy: {libholovid.occupancyReport(stages, time.time() - TpipeStart)}")
+    except BaseException:
+        stopPipeline([decoder, writer], sink, job, metricsWriter)
+        raise
+    finally:
+        cap.release()
     cv2.destroyAllWindows()
 
 
@@ -229,16 +636,23 @@ def createVidFromImgs():
 
 
 if __name__ == "__main__":
+    from PyQt5.QtWidgets import QApplication
+    from lib.libholoplayer import VideoPlayer
+
     app = QApplication(sys.argv)
 
     globalTStart = time.time()
-    loopCalcHoloGPU()
-    createVidFromImgs()
+    if farmWorkers > 0:
+        loopCalcHoloFarm()
+    else:
+        loopCalcHoloGPU()
+    if not streamVideo:
+        createVidFromImgs()
     globalTEnd = time.time()
 
     print(f"\n\033[0;34mDuration: {round(globalTEnd - globalTStart, 2)}s\033[0m")
 
-    player = VideoPlayer(outputVid)
+    player = VideoPlayer(outputVid, fps)
     player.show()
 
     sys.exit(app.exec_())
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+# 求解器基准测试，于仓库根目录执行：python utils/calcHolo/benchSolver.py [测试名 ...]
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from lib import libhologpu as libholo
+from lib import libholovid
+
+# CONFIGS
+maxIterNum = 100            # 最大迭代数
+uniThres = 0.66             # 均匀度阈值
+backend = "numpy"           # 计算后端("cupy"/"numpy")
+width, height = 1920, 1080  # 目标图像尺寸
+repeat = 3                  # 计时重复次数
+
+
+def genLatticeTarget(width=1920, height=1080, margin=50, spacing=100, radius=2):
+    """
+    生成点阵目标图像(同calcGPU.genTargetImg，不依赖cv2)
+
+    :return: target - 归一化目标图像
+    """
+    target = np.zeros((height, width))
+    yy, xx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    disk = (xx ** 2 + yy ** 2) <= radius ** 2
+    for x in range(margin, width - margin + 1, spacing):
+        for y in range(margin, height - margin + 1, spacing):
+            target[y - radius:y + radius + 1, x - radius:x + radius + 1][disk] = 1
+    return target
+
+
+def timeit(func):
+    """
+    多次运行取最短耗时
+
+    :return: result - 最后一次运行结果, duration - 最短耗时(s)
+    """
+    duration = float("inf")
+    result = None
+    for _ in range(repeat):
+        Tstart = time.time()
+        result = func()
+        duration = min(duration, time.time() - Tstart)
+    return result, duration
+
+
+def benchPrecision():
+    """
+    单/双精度求解对比：达到阈值的迭代数、均匀性、效率、耗时，以及固定迭代数下的均匀性与效率。
+    对称点阵的光场近似为实数，相位符号对舍入误差敏感，两种精度会收敛到不同但质量相当的解，故只比较评价指标
+    """
+    xp = libholo.getBackend(backend)
+    fixedIterNum = 30
+    targets = {
+        "lattice-100px": genLatticeTarget(width, height, spacing=100),
+        "lattice-200px": genLatticeTarget(width, height, spacing=200),
+    }
+
+    print(f"target          precision iters uniformity efficiency duration(s) | {fixedIterNum}-iter uniformity efficiency")
+    for name, target in targets.items():
+        results = {}
+        for precision in ("double", "single"):
+            def solve(iterNum=maxIterNum, thres=uniThres):
+                unfmList = []
+                phase, normIntensity = libholo.GSiteration(iterNum, thres, target, unfmList,
+                                                           backend=xp, precision=precision)
+                efficiency = libholo.efficiencyCalc(normIntensity, xp.asarray(target))
+                return len(unfmList), unfmList[-1], efficiency
+
+            (iters, uniformity, efficiency), duration = timeit(solve)
+            # 阈值>1时不会提前终止
+            _, fixedUniformity, fixedEfficiency = solve(fixedIterNum, 2.0)
+            results[precision] = np.array([uniformity, efficiency, fixedUniformity, fixedEfficiency])
+            print(f"{name:15s} {precision:9s} {iters:5d} {uniformity:10.4f} {efficiency:10.4f} {duration:11.3f} | "
+                  f"{fixedUniformity:18.4f} {fixedEfficiency:10.4f}")
+
+        diff = results["single"] - results["double"]
+        print(f"{name:15s} diff      {'':5s} {diff[0]:+10.4f} {diff[1]:+10.4f} {'':11s} | "
+              f"{diff[2]:+18.4f} {diff[3]:+10.4f}")
+
+
+def benchShift():
+    """
+    移位/免移位迭代对比：每次迭代耗时，并校验两者输出完全一致
+    """
+    xp = libholo.getBackend(backend)
+    iterNum = 20
+    target = xp.asarray(genLatticeTarget(width, height))
+
+    print("shiftFree per-iter(ms) identical")
+    outputs = {}
+    for shiftFree in (False, True):
+        # 阈值>1时不会提前终止
+        (phase, normIntensity), duration = timeit(lambda: libholo.GSiteration(
+            iterNum, 2.0, target, [], backend=xp, shiftFree=shiftFree))
+        outputs[shiftFree] = (libholo.toHost(phase), libholo.toHost(normIntensity))
+        identical = ""
+        if shiftFree:
+            identical = all(np.array_equal(a, b, equal_nan=True) for a, b in zip(outputs[False], outputs[True]))
+        print(f"{str(shiftFree):9s} {duration / iterNum * 1000:12.2f} {identical}")
+
+
+def genTraps(trapNum, width=1920, height=1080, margin=50):
+    """
+    在目标图像范围内均匀布置trapNum个光阱
+
+    :return: traps - 光阱坐标(M, 2)，各行为(x, y)
+    """
+    cols = int(np.ceil(np.sqrt(trapNum * width / height)))
+    rows = int(np.ceil(trapNum / cols))
+    xs = np.linspace(margin, width - margin, cols).round()
+    ys = np.linspace(margin, height - margin, rows).round()
+    traps = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+    return traps[:trapNum]
+
+
+def benchSpots():
+    """
+    GSWspots与GSiteration按光阱数的交叉点：固定迭代数下的每次迭代耗时
+    """
+    xp = libholo.getBackend(backend)
+    iterNum = 10
+
+    print("traps GSW per-iter(ms) GS per-iter(ms) faster")
+    for trapNum in (1, 4, 16, 64, 256, 1024):
+        traps = genTraps(trapNum, width, height)
+        target = np.zeros((height, width))
+        target[traps[:, 1].astype(int), traps[:, 0].astype(int)] = 1
+        target = xp.asarray(target)
+
+        # 阈值>1时不会提前终止
+        _, durationGSW = timeit(lambda: libholo.GSWspots(iterNum, 2.0, xp.asarray(traps), (height, width), [],
+                                                         backend=xp))
+        _, durationGS = timeit(lambda: libholo.GSiteration(iterNum, 2.0, target, [], backend=xp))
+        print(f"{trapNum:5d} {durationGSW / iterNum * 1000:16.2f} {durationGS / iterNum * 1000:15.2f} "
+              f"{'GSW' if durationGSW < durationGS else 'GS'}")
+
+
+def benchMRAF():
+    """
+    MRAF与加权GS对比：达到阈值的迭代数、耗时、均匀性与效率
+    """
+    xp = libholo.getBackend(backend)
+    targets = {
+        "lattice-100px": genLatticeTarget(width, height, spacing=100),
+        "lattice-200px": genLatticeTarget(width, height, spacing=200),
+    }
+    modes = [("wgs", None), ("mraf", 0.5), ("mraf", 0.7)]
+
+    for thres in (uniThres, 0.9):
+        print(f"uniThres={thres}")
+        print("target          algorithm  iters duration(s) uniformity efficiency")
+        for name, target in targets.items():
+            target = xp.asarray(target)
+            for algorithm, mixing in modes:
+                def solve():
+                    unfmList = []
+                    phase, normIntensity = libholo.GSiteration(maxIterNum, thres, target, unfmList, backend=xp,
+                                                               algorithm=algorithm, mixing=mixing or 0.5)
+                    return unfmList, libholo.efficiencyCalc(normIntensity, target)
+
+                (uniformity, efficiency), duration = timeit(solve)
+                label = algorithm if mixing is None else f"{algorithm}-{mixing}"
+                print(f"{name:15s} {label:9s} {len(uniformity):6d} {duration:11.3f} {uniformity[-1]:10.4f} "
+                      f"{efficiency:10.4f}")
+
+
+def benchLG():
+    """
+    透镜-光栅叠加与GS迭代对比(含生成全息图)：耗时与均匀性
+    """
+    xp = libholo.getBackend(backend)
+
+    print("traps LG(ms) GS(ms) speedup LG-uniformity GS-iters")
+    for trapNum in (1, 2, 4, 8):
+        traps = genTraps(trapNum, width, height)
+        target = np.zeros((height, width))
+        target[traps[:, 1].astype(int), traps[:, 0].astype(int)] = 1
+        target = xp.asarray(target)
+
+        def solveLG():
+            phase, uniformity = libholo.lgPhase(xp.asarray(traps), (height, width), backend=xp)
+            libholo.genHologram(phase)
+            return uniformity
+
+        def solveGS():
+            unfmList = []
+            phase, _ = libholo.GSiteration(maxIterNum, uniThres, target, unfmList, backend=xp)
+            libholo.genHologram(phase)
+            return len(unfmList)
+
+        uniformity, durationLG = timeit(solveLG)
+        iters, durationGS = timeit(solveGS)
+        print(f"{trapNum:5d} {durationLG * 1000:6.1f} {durationGS * 1000:6.1f} {durationGS / durationLG:7.1f} "
+              f"{uniformity:13.4f} {iters:8d}")
+
+
+def benchPyramid():
+    """
+    多分辨率GS与单层GS对比：总迭代数(各层合计)、耗时、均匀性与效率
+    """
+    xp = libholo.getBackend(backend)
+    targets = {
+        "lattice-100px": genLatticeTarget(width, height, spacing=100),
+        "lattice-200px": genLatticeTarget(width, height, spacing=200),
+    }
+    modes = [(1, None), (2, None), (3, None), (2, [10]), (3, [10, 10])]
+
+    for thres in (uniThres, 0.9):
+        print(f"uniThres={thres}")
+        print("target          levels levelIters iters duration(s) uniformity efficiency")
+        for name, target in targets.items():
+            target = xp.asarray(target)
+            for levels, levelIters in modes:
+                def solve():
+                    unfmList = []
+                    phase, normIntensity = libholo.GSpyramid(maxIterNum, thres, target, unfmList, levels, levelIters,
+                                                             backend=xp)
+                    return unfmList, libholo.efficiencyCalc(normIntensity, target)
+
+                (uniformity, efficiency), duration = timeit(solve)
+                print(f"{name:15s} {levels:6d} {str(levelIters):10s} {len(uniformity):5d} {duration:11.3f} "
+                      f"{uniformity[-1]:10.4f} {efficiency:10.4f}")
+
+
+def benchFused():
+    """
+    Numba融合核与逐项NumPy运算对比(仅NumPy后端)：每次迭代耗时及结果差异
+    """
+    xp = libholo.getBackend(backend)
+    iterNum = 20
+    target = xp.asarray(genLatticeTarget(width, height))
+
+    print("precision fused per-iter(ms) uniformity")
+    for precision in ("double", "single"):
+        # 预先编译本精度下的融合核
+        libholo.GSiteration(1, 2.0, target, [], backend=xp, precision=precision, fused=True)
+        for fused in (False, True):
+            unfmList = []
+            # 阈值>1时不会提前终止
+            _, duration = timeit(lambda: libholo.GSiteration(iterNum, 2.0, target, unfmList, backend=xp,
+                                                             precision=precision, fused=fused))
+            print(f"{precision:9s} {str(fused):5s} {duration / iterNum * 1000:13.2f} {unfmList[-1]:10.4f}")
+
+
+def benchIncremental():
+    """
+    SpotSolver增量更新与完整重新求解对比：每次移动一个光阱后的迭代数、耗时与均匀性
+    """
+    xp = libholo.getBackend(backend)
+    thres = 0.9
+    moveNum = 5
+    rng = np.random.default_rng(1)
+
+    print("traps update-iters update(s) update-uniformity | resolve-iters resolve(s) resolve-uniformity")
+    for trapNum in (16, 64):
+        solver = libholo.SpotSolver(xp.asarray(genTraps(trapNum, width, height)), (height, width), maxIterNum, thres,
+                                    backend=xp)
+        solver.solve()
+        for _ in range(moveNum):
+            index = int(rng.integers(trapNum))
+            unfmList = []
+            solver.update(move=([index], solver.traps[index:index + 1, :2] + xp.asarray([[5.0, 3.0]])),
+                          unfmList=unfmList)
+
+            fullList = []
+            fullSolver = libholo.SpotSolver(solver.traps, (height, width), maxIterNum, thres, backend=xp)
+            _, duration = timeit(lambda: fullSolver.solve(fullList))
+            print(f"{trapNum:5d} {len(unfmList):12d} {solver.latencies[-1]:9.3f} {solver.uniformity:17.4f} | "
+                  f"{len(fullList) // repeat:13d} {duration:10.3f} {fullSolver.uniformity:18.4f}")
+
+
+def benchFarm():
+    """
+    多进程求解的扩展性：不同进程数与块大小下的吞吐量(帧/s)与相对单进程的加速比
+    """
+    frameNum = 32
+    frames = [(genLatticeTarget(width, height, margin=50 + k, spacing=100) * 255).astype(np.uint8)
+              for k in range(frameNum)]
+    workerNums = sorted({1, 2, 4, 8, 16, 32, 64, os.cpu_count()} & set(range(1, os.cpu_count() + 1)))
+
+    print(f"frames={frameNum}, cpus={os.cpu_count()}")
+    print("workers chunk fps speedup")
+    baseline = None
+    for workers in workerNums:
+        for chunkSize in (1, 4):
+            with libholovid.FrameFarm((height, width), workers, chunkSize, maxIterNum=maxIterNum,
+                                      uniThres=uniThres) as farm:
+                Tstart = time.time()
+                for _ in farm.map(frames):
+                    pass
+                duration = time.time() - Tstart
+            fps = frameNum / duration
+            baseline = baseline or fps
+            print(f"{workers:7d} {chunkSize:5d} {fps:6.2f} {fps / baseline:7.2f}")
+
+
+benchmarks = {
+    "precision": benchPrecision,
+    "shift": benchShift,
+    "spots": benchSpots,
+    "mraf": benchMRAF,
+    "lg": benchLG,
+    "pyramid": benchPyramid,
+    "fused": benchFused,
+    "incremental": benchIncremental,
+    "farm": benchFarm,
+}
+
+
+if __name__ == "__main__":
+    for benchName in sys.argv[1:] or benchmarks:
+        print(f"\n\033[0;32m[{benchName}]\033[0m")
+        benchmarks[benchName]()
@@ -42,23 +42,30 @@ def main():
     maxIterNum = 100
     # 均匀度阈值
     uniThres = 0.66
+    # FFT实现，见libholo.getFFTEngine
+    fftEngine = None
+    # 每隔checkEvery次迭代检查一次收敛
+    checkEvery = 1
+    # 查询并写入全息图磁盘缓存
+    useCache = False
 
     uniformity = []
     imgPath = f"../../utils/samples/{imgName}.jpg"
 
     period = 20
 
-    # gratv = libholo.loadImg(f"../../grat_v{period}.tif")
-    # gratv = gratv.astype("float")
-    # grath = libholo.loadImg(f"../../grat_h{period}.tif")
-    # grath = grath.astype("float")
+    # 菲涅尔透镜：默认叠加标定的透镜图(8位灰度，256级对应2pi)；
+    # 给定离焦量(单位半径处的波长数)时改为解析生成，两者均为None时不加透镜
+    lensDefocus = None
+    lensFile = "../../fresnellens.tif"
+    # 光栅周期(沿x, 沿y，像素)，None时不加光栅
+    grating = None
+    # grating = (period, period)
+    # grating = (period, None)
+    # grating = (None, period)
+    # Zernike校正系数{Noll序号: 波长}，None时不加校正
+    zernike = None
 
-    fresnel = libholo.loadImg("../../fresnellens.tif")
-    fresnel = fresnel.astype("float")
-
-    # grat = gratv + grath
-    # grat = gratv
-    # grat = grath
     target = libholo.loadImg(imgPath)
 
     # target = genTargetImg()
@@ -70,19 +77,39 @@ def main():
     # CuPy类型转换(NumPy->CuPy)
     target = cp.asarray(target)
 
-    Tstart = time.time()
-    phase, normIntensity = libholo.GSiteration(maxIterNum, uniThres, target, uniformity)
+    # 透镜、光栅与Zernike校正相位在设备端解析生成，并按参数缓存
+    compositor = libholo.PhaseCompositor(target.shape, cp)
+    fresnel = None
+    if lensDefocus is None and lensFile is not None:
+        fresnel = cp.asarray(libholo.loadImg(lensFile), dtype=cp.float64) * (2 * np.pi / 256)
 
-    holo = libholo.genHologram(phase)
+    Tstart = time.time()
+    # 相同目标与参数的结果直接从磁盘缓存读取
+    cache = libholo.HoloCache() if useCache else None
+    cached = None
+    if cache is not None:
+        cacheKey = cache.key(target, maxIterNum=maxIterNum, uniThres=uniThres, algorithm="wgs", precision="double",
+                             checkEvery=checkEvery, fft=fftEngine, fused=False)
+        cached = cache.get(cacheKey, cp)
+    if cached is not None:
+        phase, metrics = cached
+        uniformity.extend(metrics["uniformity"])
+        efficiency = metrics["efficiency"]
+    else:
+        phase, normIntensity = libholo.GSiteration(maxIterNum, uniThres, target, uniformity, fft=fftEngine,
+                                                   checkEvery=checkEvery)
+        efficiency = libholo.efficiencyCalc(normIntensity, target)
+        if cache is not None:
+            cache.put(cacheKey, phase, uniformity=uniformity, efficiency=efficiency)
+
+    # 叠加透镜图与校正相位，模2pi后量化
+    if fresnel is not None:
+        phase = phase + fresnel
+    holo = compositor.compose(phase, lens=lensDefocus, grating=grating, zernike=zernike)
     # rec = libholo.reconstruct(normIntensity)
 
     # CuPy类型转换(CuPy->NumPy)
     holo = cp.asnumpy(holo)
-    holo = holo.astype("float")
-    # holo = holo + gratv
-    # holo = holo + grath
-    holo = holo + fresnel
-    holo = holo.astype("uint8")
 
     # rec = cp.asnumpy(rec)
 
@@ -99,7 +126,6 @@ def main():
     print(f"Iteration: {len(uniformity)}")
     print(f"Duration: {round(Tend - Tstart, 2)}s")
     print(f"uniformity={uniformity[-1]}")
-    efficiency = np.sum(normIntensity[target == 1]) / np.sum(target[target == 1])
     print(f"efficiency={efficiency}")
 
     # 预览